@@ -0,0 +1,172 @@
+"""
+Compare str_from_tag and markdown_from_tag with their previous implementation, which
+walked every string's parents and concatenated strings, on article fixtures.
+
+Run from the repository root:
+    python -m benchmarks.bench_bs4_tools [ARTICLE.html ...]
+"""
+
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+from benchmarks.fixtures import LINK, load_articles
+from bs4_tools import markdown_from_tag, str_from_tag
+from page_model import URL_DOMAIN
+
+
+def legacy_str_from_tag(tag: Tag, separator: str = "") -> str:
+    """
+    Return the text displayed by a Tag object as a string without any superscripts/references.
+    """
+
+    final_string = ""
+    if tag.name in ["ul", "ol", "menu"]:
+        for i, li in enumerate(tag.find_all("li")):
+            if not isinstance(li, Tag):
+                raise NotImplementedError
+            li_text = legacy_str_from_tag(li)
+            if not li_text:
+                continue
+            elif tag.name == "ol":
+                final_string += f"{i}. {li_text}\n"
+            else:
+                final_string += f"- {li_text}\n"
+    else:
+        for string in tag.strings:
+            if not isinstance(string, NavigableString):
+                raise NotImplementedError(f"Expected {string} to be NavigableString.")
+            elif string.parent is None:
+                raise NotImplementedError(f"{string} has no parent.")
+            if not string.strip("\n"):
+                continue
+            elif any(parent.name == "sup" for parent in string.parents):
+                continue
+            elif any(
+                parent.name == "span"
+                and parent.has_attr("class")
+                and "mw-editsection" in parent["class"]
+                for parent in string.parents
+            ):
+                continue
+            if separator:
+                final_string += string.strip() + separator
+            else:
+                final_string += string.strip("\n")
+
+    return final_string.rstrip()
+
+
+def legacy_markdown_from_tag(tag: Tag, url: str, url_domain: str) -> str:
+    """
+    Return the text displayed by a Tag object as markdown without any superscripts/references.
+    """
+
+    markdown = ""
+    if not isinstance(tag.name, str):
+        raise Exception("tag.name is undefined.")
+    if tag.name in ["ul", "ol", "menu"]:
+        for i, li in enumerate(tag.find_all("li")):
+            li_markdown = legacy_markdown_from_tag(li, url, url_domain)
+            if not li_markdown:
+                continue
+            elif tag.name == "ol":
+                markdown += f"{i}. {li_markdown}\n"
+            else:
+                markdown += f"- {li_markdown}\n"
+    else:
+        for string in tag.strings:
+            if not isinstance(string, NavigableString):
+                raise NotImplementedError(f"Expected {string} to be NavigableString.")
+            elif string.parent is None:
+                raise NotImplementedError(f"{string} has no parent.")
+
+            if not string.strip("\n"):
+                continue
+            elif any(parent.name == "sup" for parent in string.parents):
+                continue
+            elif any(
+                parent.name == "span"
+                and parent.has_attr("class")
+                and "mw-editsection" in parent["class"]
+                for parent in string.parents
+            ):
+                continue
+            if string.parent.name == "a":
+                href = string.parent.get("href")
+                # Checked before href, like markdown_from_tag: self-links have none.
+                if (
+                    string.parent.has_attr("class")
+                    and "mw-selflink" in string.parent["class"]
+                ):
+                    href = url
+                elif not isinstance(href, str):
+                    raise NotImplementedError("Expected href to be string.")
+                elif href.startswith("#"):
+                    href = url + href
+                else:
+                    href = url_domain + href
+
+                if match := re.search(r"^\[*", string):
+                    leading_brackets = match.group()
+                else:
+                    leading_brackets = ""
+                if match := re.search(r"\[*$", string):
+                    trailing_brackets = match.group()
+                else:
+                    trailing_brackets = ""
+                link_name = re.sub(r"[\[\]]+", "", string)
+                markdown += (
+                    leading_brackets + f"[{link_name}](<{href}>)" + trailing_brackets
+                )
+            else:
+                markdown += string.strip("\n")
+
+    if tag.name.startswith("h") and len(tag.name) == 2:
+        markdown = f'{"#" * int(tag.name[1])} {markdown}'
+
+    return markdown.rstrip()
+
+
+def block_tags(html: str) -> list[Tag]:
+    soup = BeautifulSoup(html, "html.parser")
+    content = soup.find("div", id="mw-content-text")
+    if not isinstance(content, Tag):
+        raise Exception("Expected Tag object.")
+    return content.find_all(["p", "h2", "h3", "ul", "ol"])
+
+
+def best_of(func, tags: list[Tag], repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(tags)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    for name, html in load_articles(sys.argv[1:]).items():
+        tags = block_tags(html)
+        for label, new, legacy in [
+            ("str_from_tag", str_from_tag, legacy_str_from_tag),
+            (
+                "markdown_from_tag",
+                lambda tag: markdown_from_tag(tag, LINK, URL_DOMAIN),
+                lambda tag: legacy_markdown_from_tag(tag, LINK, URL_DOMAIN),
+            ),
+        ]:
+            if [new(tag) for tag in tags] != [legacy(tag) for tag in tags]:
+                raise AssertionError(f"{label} output differs on {name}.")
+            new_time = best_of(lambda tags: [new(tag) for tag in tags], tags)
+            legacy_time = best_of(lambda tags: [legacy(tag) for tag in tags], tags)
+            print(
+                f"{name} ({len(tags)} blocks) {label}: {legacy_time * 1000:.1f} ms -> "
+                f"{new_time * 1000:.1f} ms ({legacy_time / new_time:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
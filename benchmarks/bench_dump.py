@@ -0,0 +1,77 @@
+"""
+Measure how many pages per second build_from_dump streams through, and its peak memory,
+on synthetic XML and JSON lines dumps of growing size, plain and bz2 compressed, and
+check that all of them build the same index.
+
+Run from the repository root:
+    python -m benchmarks.bench_dump [OTHER_PAGES ...]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fixtures import (
+    synthetic_dump_pages,
+    synthetic_list_pages,
+    write_json_dump,
+    write_xml_dump,
+)
+from dump_index import build_from_dump, iter_dump_pages
+
+
+def timed(func, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def peak_mib(func, *args) -> float:
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def scan(path: str) -> int:
+    return sum(1 for _ in iter_dump_pages(path))
+
+
+def build(path: str):
+    return asyncio.run(build_from_dump(path))
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 4_000]
+    list_pages = synthetic_list_pages()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            pages = synthetic_dump_pages(list_pages, size)
+            built = {}
+            for name, write in [
+                ("dump.xml", write_xml_dump),
+                ("dump.xml.bz2", write_xml_dump),
+                ("dump.ndjson", write_json_dump),
+                ("dump.ndjson.bz2", write_json_dump),
+            ]:
+                path = os.path.join(directory, name)
+                write(path, pages)
+                scan_time, count = timed(scan, path)
+                build_time, built[name] = timed(build, path)
+                print(
+                    f"{name} ({os.path.getsize(path) / 2**20:.1f} MiB, {count} pages): "
+                    f"scan {count / scan_time:,.0f} pages/s, "
+                    f"build {count / build_time:,.0f} pages/s, "
+                    f"peak {peak_mib(build, path):.1f} MiB"
+                )
+            first, *others = built.values()
+            assert all(list(first.items()) == list(other.items()) for other in others)
+            print(f"All dumps built {first}.")
+
+
+if __name__ == "__main__":
+    main()
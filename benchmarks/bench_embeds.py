@@ -0,0 +1,81 @@
+"""
+Count the messages a reply takes when every chunk is its own message versus when the
+chunks are packed into embeds, for the summary and the full content of articles.
+
+Run from the repository root:
+    python -m benchmarks.bench_embeds [ARTICLE.html ...]
+"""
+
+import asyncio
+import sys
+
+from benchmarks.fixtures import LINK, load_articles
+from create_reply import (
+    EMBED_DESCRIPTION_LIMIT,
+    EMBED_FOOTER_LIMIT,
+    EMBED_TITLE_LIMIT,
+    MESSAGE_EMBED_CHARS_LIMIT,
+    MESSAGE_EMBEDS_LIMIT,
+    continue_chunks,
+    continue_text,
+    iter_embed_messages,
+    iter_render_chunks,
+)
+from page_model import extract_page
+
+IMAGE = b"\x89PNG"
+CONTINUE_LOCATION = "Santa Cruz de Tenerife"
+
+
+async def iter_reply(chunks: list[str | bytes]):
+    for chunk in chunks:
+        yield chunk
+
+
+def check_limits(embeds: list[dict]) -> None:
+    assert len(embeds) <= MESSAGE_EMBEDS_LIMIT
+    total = 0
+    for embed in embeds:
+        assert len(embed.get("title", "")) <= EMBED_TITLE_LIMIT
+        assert 0 < len(embed.get("description", "")) <= EMBED_DESCRIPTION_LIMIT or (
+            "description" not in embed
+        )
+        assert len(embed.get("footer", {}).get("text", "")) <= EMBED_FOOTER_LIMIT
+        total += sum(
+            len(text)
+            for text in [
+                embed.get("title", ""),
+                embed.get("description", ""),
+                embed.get("footer", {}).get("text", ""),
+            ]
+        )
+    assert total <= MESSAGE_EMBED_CHARS_LIMIT
+
+
+async def main():
+    for name, html in load_articles(sys.argv[1:]).items():
+        page = extract_page(html, LINK)
+        for is_summary in [True, False]:
+            chunks = list(iter_render_chunks(page, is_summary, True))
+            plain = chunks[:1] + [IMAGE] + chunks[1:]
+            plain += continue_chunks(CONTINUE_LOCATION)
+
+            messages = [
+                message
+                async for message in iter_embed_messages(
+                    iter_reply(chunks[:1] + [IMAGE] + chunks[1:]),
+                    LINK,
+                    continue_text(CONTINUE_LOCATION),
+                )
+            ]
+            for message in messages:
+                check_limits(message.embeds)
+            embeds = sum(len(message.embeds) for message in messages)
+            print(
+                f"{name} {'summary' if is_summary else 'content'}: {len(plain)} "
+                f"messages -> {len(messages)} messages ({embeds} embeds)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Report the memory used per location by LocationsContainer, compared with the previous
+representation of a dict of lists of Location objects with a __dict__ and an
+extra_info dict each, on synthetic list table rows.
+
+Run from the repository root:
+    python -m benchmarks.bench_memory
+"""
+
+import gc
+import random
+import tracemalloc
+
+from locations_container import Location, LocationsContainer, parse_population
+
+
+class LegacyLocation:
+    def __init__(self, link: str, key: str = "", **kwargs) -> None:
+        self.key = key
+        self.link = link
+        self.extra_info = {**kwargs}
+
+        self.name: None | str = None
+        self.kind: None | str = None
+        self.population: None | int = None
+
+
+def table_rows(tables: int, rows: int, seed: int = 0):
+    """Yield (key, link, name, extra_info) like parse_rows does for city tables."""
+    rng = random.Random(seed)
+    for table in range(tables):
+        # Header strings are new objects for every table, as parsed from the HTML.
+        headers = [
+            "".join(["Ci", "ty"]),
+            "".join(["State/", "Province"]),
+            "".join(["Population ", "(2020)"]),
+            "".join(["Area ", "(km2)"]),
+        ]
+        country = f"Country {table}"
+        for row in range(rows):
+            name = f"City {table}-{row} {rng.randint(0, 10**6)}"
+            values = [
+                name,
+                f"Province {row % 20}",
+                f"{rng.randint(100_000, 10_000_000):,}",
+                f"{rng.randint(10, 5_000):,}",
+            ]
+            extra_info = {**dict(zip(headers, values)), "Country": country}
+            link = "https://en.wikipedia.org/wiki/" + name.replace(" ", "_")
+            yield name.lower(), link, name, extra_info
+
+
+def build_legacy(rows) -> dict:
+    container: dict = {}
+    for key, link, name, extra_info in rows:
+        location = LegacyLocation(link, key, **extra_info)
+        location.name = name
+        location.kind = "city"
+        location.population = parse_population(location.extra_info)
+        container[key] = container.get(key, []) + [location]
+    return container
+
+
+def build_current(rows) -> LocationsContainer:
+    locations = LocationsContainer()
+    for key, link, name, extra_info in rows:
+        location = Location(link, key, **extra_info)
+        location.name = name
+        location.kind = "city"
+        location.population = parse_population(location.extra_info)
+        locations[key] = location
+    return locations
+
+
+def traced_bytes(build, tables: int, rows: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = build(table_rows(tables, rows))
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    for tables, rows in [(100, 100), (400, 100)]:
+        count = tables * rows
+        legacy = traced_bytes(build_legacy, tables, rows)
+        current = traced_bytes(build_current, tables, rows)
+        print(
+            f"{count} locations: {legacy / count:.0f} -> {current / count:.0f} bytes "
+            f"per location ({legacy / 2**20:.1f} -> {current / 2**20:.1f} MiB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
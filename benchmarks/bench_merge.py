@@ -0,0 +1,46 @@
+"""
+Measure the cost of combining many LocationsContainer objects, e.g. one per country
+list page.
+
+Run from the repository root:
+    python -m benchmarks.bench_merge
+"""
+
+import time
+
+from locations_container import Location, LocationsContainer, combine
+
+
+def make_container(index: int, size: int) -> LocationsContainer:
+    locations = LocationsContainer()
+    for i in range(size):
+        key = f"city {index}-{i}"
+        locations[key] = Location(
+            f"https://en.wikipedia.org/wiki/City_{index}_{i}",
+            key,
+            Population=str(i),
+            Country=f"Country {index}",
+        )
+    # Names shared between pages, as with states/districts that span several tables.
+    shared_key = f"shared {index % 10}"
+    locations[shared_key] = Location(
+        f"https://en.wikipedia.org/wiki/Shared_{index % 10}", shared_key
+    )
+
+    return locations
+
+
+def main():
+    for count in [10, 50, 100, 200, 400]:
+        containers = [make_container(i, 200) for i in range(count)]
+        start = time.perf_counter()
+        combined = combine(*containers)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{count:4d} containers -> {combined}: {elapsed * 1000:8.1f} ms "
+            f"({elapsed / count * 1e6:7.1f} us per container)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare the time and peak memory of extract_page parsing only the title and main
+content (partial=True) with the full parse of the whole article, on article fixtures,
+and check that both render the same replies.
+
+Run from the repository root:
+    python -m benchmarks.bench_partial_parse [ARTICLE.html ...]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fixtures import LINK, load_articles
+from page_model import Page, extract_page
+
+
+def best_of(html: str, partial: bool, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract_page(html, LINK, partial)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_mib(html: str, partial: bool) -> float:
+    tracemalloc.start()
+    extract_page(html, LINK, partial)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def replies(page: Page) -> list[list[str]]:
+    return [
+        [page.get_title(is_markdown), page.image_url or ""]
+        + list(page.iter_lines(is_summary, is_markdown))
+        for is_summary in [True, False]
+        for is_markdown in [True, False]
+    ]
+
+
+def main():
+    for name, html in load_articles(sys.argv[1:]).items():
+        if replies(extract_page(html, LINK)) != replies(
+            extract_page(html, LINK, partial=True)
+        ):
+            raise AssertionError(f"Partial parse renders differently on {name}.")
+        full_time, partial_time = best_of(html, False), best_of(html, True)
+        full_peak, partial_peak = peak_mib(html, False), peak_mib(html, True)
+        print(
+            f"{name} ({len(html) / 1024:.0f} KiB): {full_time * 1000:.1f} ms -> "
+            f"{partial_time * 1000:.1f} ms ({full_time / partial_time:.1f}x), "
+            f"peak {full_peak:.1f} MiB -> {partial_peak:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
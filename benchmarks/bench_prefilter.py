@@ -0,0 +1,64 @@
+"""
+Measure how long LocationMatcher.find takes per chat message with the first-run
+pre-filter, compared to always scanning with the automaton, and how many messages the
+pre-filter rejects.
+
+Run from the repository root:
+    python -m benchmarks.bench_prefilter
+"""
+
+import random
+import time
+
+from location_matcher import LocationMatcher
+
+SYLLABLES = ["san", "ta", "cruz", "ber", "lin", "pa", "ris", "mo", "ka", "do", "vi"]
+WORDS = (
+    "the a to and i you it is that of in for on was with my this but have just "
+    "lol what do so not be are like can go at get time today when going think know "
+    "really good yeah see one about all out up we they one2 ok sure thanks"
+).split()
+
+
+def place_name(rng: random.Random) -> str:
+    words = [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(rng.randint(1, 3))
+    ]
+    return " ".join(words)
+
+
+def best_of(func, messages: list[str], repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            func(message)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    rng = random.Random(0)
+    matcher = LocationMatcher({place_name(rng) for _ in range(50_000)})
+    messages = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+        for _ in range(5_000)
+    ]
+    # Every tenth message mentions a place.
+    for i in range(0, len(messages), 10):
+        messages[i] += f" in {rng.choice(matcher.keys)}!"
+
+    scan_time = best_of(matcher.find_spans, messages)
+    find_time = best_of(matcher.find, messages)
+    rejected = sum(not matcher.may_mention(message) for message in messages)
+    print(
+        f"{len(matcher.keys)} keys, {len(messages)} messages: "
+        f"{scan_time / len(messages) * 1e6:.1f} us -> "
+        f"{find_time / len(messages) * 1e6:.1f} us per message, "
+        f"{rejected / len(messages):.0%} rejected"
+    )
+
+
+if __name__ == "__main__":
+    main()
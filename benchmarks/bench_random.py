@@ -0,0 +1,59 @@
+"""
+Compare random_location's previous cost of flattening the container on every call with
+choosing from the cached flat list, uniformly and weighted by population.
+
+Run from the repository root:
+    python -m benchmarks.bench_random
+"""
+
+import asyncio
+import random
+import time
+
+from benchmarks.bench_merge import make_container
+from locations_container import combine
+
+
+def per_call(func, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+async def main():
+    containers = [make_container(i, 200) for i in range(200)]
+    for container in containers:
+        for location in container.locations:
+            location.name = location.link
+            location.population = random.randint(100_000, 10_000_000)
+    # Populations are read when locations are added, i.e. here.
+    locations = combine(*containers)
+    count = len(locations.locations)
+
+    # The dict of lists the container used to keep.
+    container = dict(locations.items())
+    legacy = per_call(
+        lambda: random.choice(
+            [location for key in container.values() for location in key]
+        ),
+        20,
+    )
+    uniform = per_call(lambda: random.choice(locations.locations), 10_000)
+    locations.cum_weights("population")
+    weighted = per_call(
+        lambda: random.choices(
+            locations.locations, cum_weights=locations.cum_weights("population")
+        ),
+        10_000,
+    )
+    await locations.random_location(weight="population")
+    print(
+        f"{count} locations: flatten per call {legacy * 1e6:.1f} us, "
+        f"cached uniform {uniform * 1e6:.2f} us, "
+        f"cached population weighted {weighted * 1e6:.2f} us"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
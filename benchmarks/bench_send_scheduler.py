@@ -0,0 +1,148 @@
+"""
+Send interleaved long replies to fake channels that enforce Discord-like per-channel
+and global rate limits, through SendScheduler, and check that no send is rate limited,
+that each channel gets its messages in order, and that channels are served round robin:
+a short reply arriving during long ones is not queued behind them.
+
+Run from the repository root:
+    python -m benchmarks.bench_send_scheduler [CHANNELS] [MESSAGES]
+"""
+
+import asyncio
+import sys
+import time
+
+from send_scheduler import RateWindow, SendScheduler
+
+CHANNEL_LIMIT = 5
+CHANNEL_PERIOD = 0.5
+GLOBAL_LIMIT = 10
+GLOBAL_PERIOD = 0.25
+LATENCY = 0.01
+
+
+class RateLimited(Exception):
+    """What Discord answers with a 429."""
+
+
+class FakeDiscord:
+    """Counts sends against the same windows as Discord, and rejects those over them."""
+
+    def __init__(self) -> None:
+        self.global_window = RateWindow(GLOBAL_LIMIT, GLOBAL_PERIOD)
+        self.log: list[tuple[float, int, int]] = []
+        self.rate_limited = 0
+
+    def check(self, channel: "FakeChannel") -> None:
+        now = time.monotonic()
+        for window in (channel.window, self.global_window):
+            # The scheduler takes a send just before the request reaches the fake, so
+            # the fake sees it a little later, and allows for that.
+            if window.delay(now) > 0.005:
+                self.rate_limited += 1
+                raise RateLimited(f"429 in channel {channel.id}")
+        channel.window.take(now)
+        self.global_window.take(now)
+
+
+class FakeChannel:
+    def __init__(self, id: int, discord: FakeDiscord) -> None:
+        self.id = id
+        self.discord = discord
+        self.window = RateWindow(CHANNEL_LIMIT, CHANNEL_PERIOD)
+        self.received: list[int] = []
+
+    async def send(self, number: int) -> None:
+        self.discord.check(self)
+        self.discord.log.append((time.monotonic(), self.id, number))
+        # Messages are only posted once the request comes back. The latency is the
+        # same for every send, so channels only differ by their turn in the rotation.
+        await asyncio.sleep(LATENCY)
+        self.received.append(number)
+
+
+async def stream_reply(scheduler: SendScheduler, channel: FakeChannel, count: int):
+    """Send each message once the previous one is sent, like send_chunks."""
+    for number in range(count):
+        await scheduler.send(channel, number)
+
+
+async def burst_reply(scheduler: SendScheduler, channel: FakeChannel, count: int):
+    """Queue every message at once, so the scheduler alone keeps their order."""
+    await asyncio.gather(*[scheduler.send(channel, number) for number in range(count)])
+
+
+def check_round_robin(
+    log: list[tuple[float, int, int]], channels: list[int], messages: int
+) -> None:
+    """
+    Until the first long reply is done, no channel gets more than two sends ahead of
+    another: one for the rotation, and one for replies that queue each message only
+    once the previous one is sent.
+    """
+    sent = dict.fromkeys(channels, 0)
+    for _, channel_id, _ in log:
+        if channel_id not in sent:
+            continue
+        sent[channel_id] += 1
+        if max(sent.values()) - min(sent.values()) > 2:
+            raise AssertionError(f"Channels served unevenly: {sent}")
+        if sent[channel_id] == messages:
+            return
+
+
+async def main():
+    channels_count = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    discord = FakeDiscord()
+    scheduler = SendScheduler(
+        CHANNEL_LIMIT, CHANNEL_PERIOD, GLOBAL_LIMIT, GLOBAL_PERIOD
+    )
+    channels = [FakeChannel(id, discord) for id in range(channels_count)]
+    late = FakeChannel(channels_count, discord)
+
+    async def late_reply():
+        await asyncio.sleep(1)
+        queued = time.monotonic()
+        await stream_reply(scheduler, late, 3)
+        return time.monotonic() - queued
+
+    start = time.monotonic()
+    *_, late_seconds = await asyncio.gather(
+        *[
+            (burst_reply if channel.id % 2 else stream_reply)(
+                scheduler, channel, messages
+            )
+            for channel in channels
+        ],
+        late_reply(),
+    )
+    elapsed = time.monotonic() - start
+    scheduler.close()
+
+    total = channels_count * messages + 3
+    assert discord.rate_limited == 0, f"{discord.rate_limited} sends rate limited"
+    for channel in [*channels, late]:
+        assert channel.received == sorted(channel.received), channel.id
+        assert len(channel.received) == (3 if channel is late else messages)
+    check_round_robin(
+        [entry for entry in discord.log if entry[1] != late.id],
+        [channel.id for channel in channels],
+        messages,
+    )
+    # The short reply waits for its turns among the channels, not for their backlog:
+    # each of its messages goes out within one rotation through them.
+    rotation = channels_count / GLOBAL_LIMIT * GLOBAL_PERIOD
+    assert late_seconds < 3 * (rotation + LATENCY) + 0.5, late_seconds
+    lower_bound = (total / GLOBAL_LIMIT - 1) * GLOBAL_PERIOD
+    print(
+        f"{total} sends to {channels_count + 1} channels in {elapsed:.2f}s "
+        f"(global limit allows {lower_bound:.2f}s, a fixed 0.5 s sleep per "
+        f"message {messages * 0.5:.0f}s), 0 rate limited, order kept, "
+        f"late 3-message reply done in {late_seconds:.2f}s"
+    )
+    print(scheduler.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
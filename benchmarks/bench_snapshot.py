@@ -0,0 +1,44 @@
+"""
+Compare building the location index from Wikipedia with loading it from a snapshot.
+
+Run from the repository root:
+    python -m benchmarks.bench_snapshot [--skip-scrape] [--snapshot PATH]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from locations_container import LocationsContainer
+from locations_from_wiki import create_locations
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default="locations_snapshot.json.gz")
+    parser.add_argument("--skip-scrape", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not args.skip_scrape or not os.path.exists(args.snapshot):
+        start = time.perf_counter()
+        locations = await create_locations()
+        print(f"Cold scrape: {time.perf_counter() - start:.2f}s ({locations})")
+        locations.save_snapshot(args.snapshot)
+    print(f"Snapshot size: {os.path.getsize(args.snapshot) / 1024:.0f} KiB")
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        locations = LocationsContainer.load_snapshot(args.snapshot)
+        timings.append(time.perf_counter() - start)
+    print(f"Snapshot load: best {min(timings):.3f}s ({locations})")
+
+    start = time.perf_counter()
+    locations.build_matcher()
+    print(f"Matcher build: {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
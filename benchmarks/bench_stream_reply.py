@@ -0,0 +1,67 @@
+"""
+Compare the time to the first message of a reply when it waits for the whole page to
+be extracted with when it starts from the lead (title, image and summary) while the
+rest is extracted, on article fixtures of growing length, and check that both send the
+same chunks.
+
+Run from the repository root:
+    python -m benchmarks.bench_stream_reply [ARTICLE.html ...]
+"""
+
+import asyncio
+import sys
+import time
+
+from benchmarks.fixtures import LINK, load_articles, synthetic_article
+from create_reply import iter_render_chunks, iter_stream_chunks
+from page_model import Page, extract_page
+
+
+def best_of(func, *args, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def first_chunk(html: str, lead: bool) -> str:
+    page = extract_page(html, LINK, partial=True, lead=lead)
+    return next(iter_render_chunks(page, True, True))
+
+
+async def streamed(
+    lead: Page, page: Page, is_summary: bool, is_markdown: bool
+) -> list[str]:
+    rest = asyncio.get_running_loop().create_future()
+    rest.set_result(page)
+    return [
+        chunk async for chunk in iter_stream_chunks(lead, is_summary, is_markdown, rest)
+    ]
+
+
+def main():
+    articles = load_articles(sys.argv[1:])
+    if not sys.argv[1:]:
+        articles["synthetic-huge"] = synthetic_article(sections=300, seed=2)
+    for name, html in articles.items():
+        page = extract_page(html, LINK, partial=True)
+        lead = extract_page(html, LINK, lead=True)
+        for is_summary in [True, False]:
+            for is_markdown in [True, False]:
+                expected = list(iter_render_chunks(page, is_summary, is_markdown))
+                chunks = asyncio.run(streamed(lead, page, is_summary, is_markdown))
+                if chunks != expected:
+                    raise AssertionError(f"Streamed reply differs on {name}.")
+        whole = best_of(first_chunk, html, False, repeat=3)
+        streaming = best_of(first_chunk, html, True)
+        print(
+            f"{name} ({len(html) / 1024:.0f} KiB): first message after "
+            f"{whole * 1000:.1f} ms -> {streaming * 1000:.1f} ms "
+            f"({whole / streaming:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
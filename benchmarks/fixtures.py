@@ -0,0 +1,278 @@
+"""
+Article fixtures for the benchmarks. Saved Wikipedia article HTML files can be passed
+on the command line; otherwise a synthetic article with the same structure is used.
+Synthetic list pages, as wikitext and as rendered HTML, and dump files made of them
+are used to build the index offline.
+"""
+
+import bz2
+import json
+import random
+from collections.abc import Iterable
+from pathlib import Path
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from locations_from_wiki import CITIES_LINK, CONTINENTS_LINK, COUNTRIES_LINK
+
+LINK = "https://en.wikipedia.org/wiki/Santa_Cruz"
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    parts = []
+    for i in range(words):
+        roll = rng.random()
+        if roll < 0.2:
+            parts.append(f'<a href="/wiki/Link_{i}" title="Link {i}">link [{i}]</a>')
+        elif roll < 0.25:
+            parts.append(
+                f'<sup class="reference"><a href="#cite_note-{i}">[{i}]</a></sup>'
+            )
+        elif roll < 0.27:
+            parts.append(f'<a href="#Section_{i}">[[anchor]]</a>')
+        elif roll < 0.3:
+            parts.append("<b>bold <i>text</i></b>\n")
+        else:
+            parts.append(f"word{i} sentence. ")
+    return f"<p>{' '.join(parts)}</p>\n"
+
+
+def synthetic_article(sections: int = 40, seed: int = 0) -> str:
+    """Return the HTML of a Wikipedia-like article with the given number of sections."""
+    rng = random.Random(seed)
+    html = [
+        '<html><head><script>RLCONF={"wgRevisionId":1234567};</script></head><body>',
+        '<nav><ul><li><a href="/wiki/Main_Page">Main page</a></li></ul></nav>',
+        '<h1 id="firstHeading"><span class="mw-page-title-main">Santa Cruz</span></h1>',
+        '<div id="p-lang-btn" class="vector-menu"><ul>',
+        *[
+            f'<li class="interlanguage-link"><a href="https://l{i}.wikipedia.org/wiki/'
+            f'Santa_Cruz" title="Santa Cruz – Language {i}" lang="l{i}">Language {i}'
+            "</a></li>"
+            for i in range(250)
+        ],
+        "</ul></div>",
+        '<div id="mw-content-text" class="mw-body-content">',
+        '<div class="mw-parser-output">',
+        '<table class="infobox"><tr><td><img src="//upload.wikimedia.org/x.png">',
+        "</td></tr><tr><td><p>Infobox paragraph</p></td></tr></table>",
+        "<style>.mw-parser-output .hatnote{font-style:italic}</style>",
+    ]
+    html += [_paragraph(rng, 60) for _ in range(3)]
+    for section in range(sections):
+        html.append(
+            f'<div class="mw-heading mw-heading2"><h2 id="S{section}">Section '
+            f'{section}</h2><span class="mw-editsection">[<a href="/edit">edit</a>]'
+            "</span></div>"
+        )
+        html += [_paragraph(rng, 80) for _ in range(4)]
+        html.append(f"<h3>Subsection {section}</h3>")
+        html.append(
+            '<ul><li>One <a href="/wiki/A">A</a></li><li></li>'
+            '<li>Back to <a class="mw-selflink selflink">Santa Cruz</a></li>'
+            "<li>Two<ul><li>Nested</li></ul></li></ul>"
+        )
+        html.append("<ol><li>First</li><li>Second<sup>[1]</sup></li></ol>")
+    html.append('<h2 id="See_also">See also</h2><ul><li>Other</li></ul>')
+    html.append('<h2 id="References">References</h2><ol class="references">')
+    html += [f"<li>Reference {i}</li>" for i in range(400)]
+    html.append("</ol>")
+    for navbox in range(3):
+        html.append(f'<div class="navbox"><table><tr><th>Navbox {navbox}</th><td>')
+        html += [
+            f'<a href="/wiki/Place_{navbox}_{i}" title="Place {i}">Place {i}</a> · '
+            for i in range(200)
+        ]
+        html.append("</td></tr></table></div>")
+    html.append("</div></div><footer>Footer</footer></body></html>")
+
+    return "".join(html)
+
+
+def load_articles(paths: list[str]) -> dict[str, str]:
+    """Return {name: html} for the given files, or synthetic articles if none."""
+    if paths:
+        return {
+            Path(path).stem: Path(path).read_text(encoding="utf-8") for path in paths
+        }
+    return {
+        "synthetic-small": synthetic_article(5),
+        "synthetic-large": synthetic_article(80),
+    }
+
+
+def _anchor(title: str, label: str | None = None) -> str:
+    path = quote(title.replace(" ", "_"), safe=";@$!*(),/~:")
+    return f'<a href="/wiki/{path}" title="{title}">{label or title}</a>'
+
+
+def _title(link: str) -> str:
+    return link.split("/wiki/")[-1].replace("_", " ")
+
+
+def synthetic_list_pages(
+    groups: int = 10, countries: int = 5, cities: int = 40, seed: int = 0
+) -> dict[str, tuple[str, str]]:
+    """
+    Return {title: (wikitext, html)} of the list pages the index is built from: the
+    cities home page, its country pages, and the countries and continents pages.
+    """
+    rng = random.Random(seed)
+    home = _title(CITIES_LINK)
+    pages = {}
+    group_titles = [f"{home}/country: G{group}" for group in range(groups)]
+    pages[home] = (
+        "\n".join(f"* [[{title}|G{i}]]" for i, title in enumerate(group_titles)),
+        "<ul>"
+        + "".join(
+            f"<li>{_anchor(title, f'G{i}')}</li>"
+            for i, title in enumerate(group_titles)
+        )
+        + "</ul>",
+    )
+
+    country_names = []
+    for group, title in enumerate(group_titles):
+        wikitext, html = ["Cities by country.<ref>Source</ref>"], ["<p>Cities.</p>"]
+        for country in range(countries):
+            name = f"Country {group}-{country}"
+            country_names.append(name)
+            wikitext += [
+                f"== [[{name}]] ==",
+                '{| class="wikitable sortable"',
+                "! City !! Province !! Population (2020)<ref>Census</ref>",
+            ]
+            html += [
+                f'<div class="mw-heading mw-heading2"><h2 id="{name}">{_anchor(name)}'
+                '</h2><span class="mw-editsection">[edit]</span></div>',
+                '<table class="wikitable sortable"><tbody><tr><th>City</th>'
+                "<th>Province</th><th>Population (2020)"
+                '<sup class="reference"><a href="#cite_note-1">[1]</a></sup></th></tr>',
+            ]
+            for city in range(cities):
+                city_name = f"Town {rng.randint(0, 10**6)} {group}-{country}-{city}"
+                province = f"Province {group}-{country}-{city % 7}"
+                population = rng.randint(100_000, 10_000_000)
+                wikitext += [
+                    "|-",
+                    f"| [[{city_name}]] || [[{province}|{province}]] "
+                    f"|| {{{{formatnum:{population}}}}}",
+                ]
+                html.append(
+                    f"<tr><td>{_anchor(city_name)}</td><td>{_anchor(province)}</td>"
+                    f"<td>{population:,}</td></tr>"
+                )
+            wikitext.append("|}")
+            html.append("</tbody></table>")
+        pages[title] = ("\n".join(wikitext), "".join(html))
+
+    continents = ["Africa", "Asia", "Europe", "Oceania"]
+    wikitext = [
+        '{| class="wikitable sortable"',
+        "! Location !! Population (1 July 2023) !! Change !! UN Continental Region",
+        "|-",
+        "| World || 8,045,311,447 || 0.9% || –",
+    ]
+    html = [
+        '<table class="wikitable sortable"><tbody><tr><th>Location</th>'
+        "<th>Population (1 July 2023)</th><th>Change</th>"
+        "<th>UN Continental Region</th></tr>"
+        "<tr><td>World</td><td>8,045,311,447</td><td>0.9%</td><td>–</td></tr>"
+    ]
+    for name in country_names:
+        population = rng.randint(10_000, 10**9)
+        continent = rng.choice(continents)
+        wikitext += [
+            "|-",
+            f"| {{{{flagcountry|{name}}}}} || {{{{formatnum:{population}}}}} "
+            f"|| 1.0% || [[{continent}]]",
+        ]
+        html.append(
+            f'<tr><td><span class="flagicon"><img src="//flag.svg"></span> '
+            f"{_anchor(name)}</td><td>{population:,}</td><td>1.0%</td>"
+            f"<td>{_anchor(continent)}</td></tr>"
+        )
+    wikitext.append("|}")
+    html.append("</tbody></table>")
+    pages[_title(COUNTRIES_LINK)] = ("\n".join(wikitext), "".join(html))
+
+    wikitext = [
+        '{| class="wikitable sortable"',
+        "! Continent !! Population (2021) !! Countries (2021)",
+        "|-",
+        "! World || 7,909,295,000 || 249",
+    ]
+    html = [
+        '<table class="wikitable sortable"><tbody><tr><th>Continent</th>'
+        "<th>Population (2021)</th><th>Countries (2021)</th></tr>"
+        "<tr><th>World</th><th>7,909,295,000</th><th>249</th></tr>"
+    ]
+    for continent in continents:
+        population = rng.randint(10**7, 5 * 10**9)
+        wikitext += ["|-", f"! [[{continent}]] || {{{{formatnum:{population}}}}} || 50"]
+        html.append(
+            f"<tr><th>{_anchor(continent)}</th><th>{population:,}</th><th>50</th></tr>"
+        )
+    wikitext.append("|}")
+    html.append("</tbody></table>")
+    pages[_title(CONTINENTS_LINK)] = ("\n".join(wikitext), "".join(html))
+
+    return pages
+
+
+def synthetic_dump_pages(
+    list_pages: dict[str, tuple[str, str]], other_pages: int, seed: int = 0
+) -> list[tuple[str, str, str]]:
+    """
+    Return (title, wikitext, html) of other_pages short articles with the list pages
+    spread among them, like a slice of a full dump.
+    """
+    rng = random.Random(seed)
+    pages = [
+        (
+            f"Article {i}",
+            "\n\n".join(
+                " ".join(f"[[Link {rng.randint(0, 999)}]] word{j}" for j in range(60))
+                for _ in range(5)
+            ),
+            _paragraph(rng, 300),
+        )
+        for i in range(other_pages)
+    ]
+    for title, (wikitext, html) in list_pages.items():
+        pages.insert(rng.randint(0, len(pages)), (title, wikitext, html))
+    return pages
+
+
+def _open_dump(path: str):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "wt", encoding="utf-8")
+    return open(path, "wt", encoding="utf-8")
+
+
+def write_xml_dump(path: str, pages: Iterable[tuple[str, str, str]]) -> None:
+    """Write the wikitext of pages as a MediaWiki XML export."""
+    with _open_dump(path) as file:
+        file.write(
+            '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/">\n'
+            "<siteinfo><sitename>Wikipedia</sitename></siteinfo>\n"
+        )
+        for page_id, (title, wikitext, _) in enumerate(pages):
+            file.write(
+                f"<page><title>{escape(title)}</title><ns>0</ns><id>{page_id}</id>"
+                f"<revision><id>{page_id}</id><text>{escape(wikitext)}</text>"
+                "</revision></page>\n"
+            )
+        file.write("</mediawiki>\n")
+
+
+def write_json_dump(path: str, pages: Iterable[tuple[str, str, str]]) -> None:
+    """Write the HTML of pages as JSON lines, like a Wikimedia Enterprise HTML dump."""
+    with _open_dump(path) as file:
+        for title, _, html in pages:
+            page = {
+                "name": title,
+                "namespace": {"identifier": 0},
+                "article_body": {"html": html},
+            }
+            file.write(json.dumps(page) + "\n")
@@ -6,9 +6,13 @@ import os
 import discord
 from discord.ext import commands
 
+from http_client import get_client
 from keep_alive import keep_alive
 from locations_container import LocationsContainer
-from locations_from_wiki import create_locations
+from locations_from_wiki import IndexRefresher, load_locations
+from parse_pool import get_pool
+from send_scheduler import send_scheduler
+from work_pool import work_pool
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +21,74 @@ class MyBot(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.locations = LocationsContainer()
+        self.refresher = IndexRefresher(
+            concurrency=int(os.environ.get("INDEX_CONCURRENCY", 8)),
+            retries=int(os.environ.get("INDEX_RETRIES", 2)),
+            timeout=float(os.environ.get("INDEX_TIMEOUT", 30)),
+        )
+        self.snapshot_path = os.environ.get(
+            "LOCATIONS_SNAPSHOT", "locations_snapshot.json.gz"
+        )
+        self.refresh_task: asyncio.Task | None = None
 
     async def setup_hook(self) -> None:
-        self.locations = await create_locations()
+        self.locations = await load_locations(
+            self.snapshot_path,
+            max_age=float(os.environ.get("LOCATIONS_MAX_AGE", 7 * 24 * 60 * 60)),
+            rebuild=os.environ.get("REBUILD_LOCATIONS", "") == "1",
+            refresher=self.refresher,
+        )
+        refresh_interval = float(
+            os.environ.get("LOCATIONS_REFRESH_INTERVAL", 24 * 60 * 60)
+        )
+        if refresh_interval > 0:
+            self.refresh_task = asyncio.create_task(
+                self.refresh_periodically(refresh_interval)
+            )
         async with asyncio.TaskGroup() as tg:
             for cog_file in os.listdir("cogs"):
                 if cog_file.endswith(".py"):
                     tg.create_task(self.load_extension(f"cogs.{cog_file[:-3]}"))
 
+    async def refresh_locations(self) -> bool:
+        """
+        Rebuild the index from the list pages that changed and swap it in, unless the
+        refresher kept the current one. Cogs read self.locations, so messages being
+        handled keep the index they started with.
+        """
+        locations = await self.refresher.build()
+        if locations is not None:
+            self.locations = locations
+        # Saving also renews the snapshot's timestamp when nothing changed, as the index
+        # was just confirmed current. Snapshots count as fresh for LOCATIONS_MAX_AGE,
+        # so one is only written when every list page was fetched.
+        if self.refresher.last_build_complete:
+            await asyncio.to_thread(
+                self.locations.save_snapshot,
+                self.snapshot_path,
+                self.refresher.snapshot_pages(self.locations),
+            )
+        else:
+            logger.warning("Not saving the snapshot, some list pages failed.")
+        return locations is not None
+
+    async def refresh_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_locations()
+            except Exception as e:
+                logger.warning(f"Could not refresh locations: {e!r}")
+
+    async def close(self) -> None:
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+        await super().close()
+        await get_client().close()
+        get_pool().close()
+        send_scheduler.close()
+        work_pool.close()
+
     async def load_extension(self, *args, **kwargs):
         await super().load_extension(*args, **kwargs)
         logger.info(f"Loaded {args[0]}.")
@@ -1,17 +1,51 @@
 import logging
-import re
+from collections.abc import Iterator
 
 from bs4 import NavigableString, Tag
 
 logger = logging.getLogger(__name__)
 
 
+def is_excluded(tag: Tag) -> bool:
+    """Return whether the tag's text isn't displayed, e.g. references and edit links."""
+    return tag.name == "sup" or (
+        tag.name == "span"
+        and tag.has_attr("class")
+        and "mw-editsection" in tag["class"]
+    )
+
+
+def displayed_strings(tag: Tag) -> Iterator[NavigableString]:
+    """
+    Yield the strings of tag.strings in a single traversal, pruning excluded subtrees on
+    the way down instead of checking the parents of every string.
+    """
+    if any(is_excluded(parent) for parent in [tag, *tag.parents]):
+        return
+    types = tag.interesting_string_types
+
+    stack = [iter(tag.contents)]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, Tag):
+                if not is_excluded(child):
+                    stack.append(iter(child.contents))
+                    break
+            elif isinstance(types, type):
+                if type(child) is types:
+                    yield child
+            elif type(child) in types:
+                yield child
+        else:
+            stack.pop()
+
+
 def str_from_tag(tag: Tag, separator: str = "") -> str:
     """
     Return the text displayed by a Tag object as a string without any superscripts/references.
     """
 
-    final_string = ""
+    parts = []
     if tag.name in ["ul", "ol", "menu"]:
         for i, li in enumerate(tag.find_all("li")):
             if not isinstance(li, Tag):
@@ -20,32 +54,19 @@ def str_from_tag(tag: Tag, separator: str = "") -> str:
             if not li_text:
                 continue
             elif tag.name == "ol":
-                final_string += f"{i}. {li_text}\n"
+                parts.append(f"{i}. {li_text}\n")
             else:
-                final_string += f"- {li_text}\n"
+                parts.append(f"- {li_text}\n")
     else:
-        for string in tag.strings:
-            if not isinstance(string, NavigableString):
-                raise NotImplementedError(f"Expected {string} to be NavigableString.")
-            elif string.parent is None:
-                raise NotImplementedError(f"{string} has no parent.")
+        for string in displayed_strings(tag):
             if not string.strip("\n"):
                 continue
-            elif any(parent.name == "sup" for parent in string.parents):
-                continue
-            elif any(
-                parent.name == "span"
-                and parent.has_attr("class")
-                and "mw-editsection" in parent["class"]
-                for parent in string.parents
-            ):
-                continue
             if separator:
-                final_string += string.strip() + separator
+                parts.append(string.strip() + separator)
             else:
-                final_string += string.strip("\n")
+                parts.append(string.strip("\n"))
 
-    return final_string.rstrip()
+    return "".join(parts).rstrip()
 
 
 def markdown_from_tag(tag: Tag, url: str, url_domain: str) -> str:
@@ -53,7 +74,7 @@ def markdown_from_tag(tag: Tag, url: str, url_domain: str) -> str:
     Return the text displayed by a Tag object as markdown without any superscripts/references.
     """
 
-    markdown = ""
+    parts = []
     if not isinstance(tag.name, str):
         raise Exception("tag.name is undefined.")
     if tag.name in ["ul", "ol", "menu"]:
@@ -62,57 +83,38 @@ def markdown_from_tag(tag: Tag, url: str, url_domain: str) -> str:
             if not li_markdown:
                 continue
             elif tag.name == "ol":
-                markdown += f"{i}. {li_markdown}\n"
+                parts.append(f"{i}. {li_markdown}\n")
             else:
-                markdown += f"- {li_markdown}\n"
+                parts.append(f"- {li_markdown}\n")
     else:
-        for string in tag.strings:
-            if not isinstance(string, NavigableString):
-                raise NotImplementedError(f"Expected {string} to be NavigableString.")
-            elif string.parent is None:
-                raise NotImplementedError(f"{string} has no parent.")
-
+        for string in displayed_strings(tag):
             if not string.strip("\n"):
                 continue
-            elif any(parent.name == "sup" for parent in string.parents):
-                continue
-            elif any(
-                parent.name == "span"
-                and parent.has_attr("class")
-                and "mw-editsection" in parent["class"]
-                for parent in string.parents
-            ):
-                continue
-            if string.parent.name == "a":
-                href = string.parent.get("href")
-                if not isinstance(href, str):
-                    raise NotImplementedError("Expected href to be string.")
-
-                if (
-                    string.parent.has_attr("class")
-                    and "mw-selflink" in string.parent["class"]
-                ):
+            parent = string.parent
+            if parent is not None and parent.name == "a":
+                href = parent.get("href")
+                # Self-links are written without an href.
+                if parent.has_attr("class") and "mw-selflink" in parent["class"]:
                     href = url
+                elif not isinstance(href, str):
+                    raise NotImplementedError("Expected href to be string.")
                 elif href.startswith("#"):
                     href = url + href
                 else:
                     href = url_domain + href
 
-                if match := re.search(r"^\[*", string):
-                    leading_brackets = match.group()
-                else:
-                    leading_brackets = ""
-                if match := re.search(r"\[*$", string):
-                    trailing_brackets = match.group()
-                else:
-                    trailing_brackets = ""
-                link_name = re.sub(r"[\[\]]+", "", string)
-                markdown += (
+                leading_brackets = string[: len(string) - len(string.lstrip("["))]
+                # Like r"\[*$", brackets before a final newline also count as trailing.
+                end = string[:-1] if string.endswith("\n") else string
+                trailing_brackets = end[len(end.rstrip("[")) :]
+                link_name = string.replace("[", "").replace("]", "")
+                parts.append(
                     leading_brackets + f"[{link_name}](<{href}>)" + trailing_brackets
                 )
             else:
-                markdown += string.strip("\n")
+                parts.append(string.strip("\n"))
 
+    markdown = "".join(parts)
     if tag.name.startswith("h") and len(tag.name) == 2:
         markdown = f'{"#" * int(tag.name[1])} {markdown}'
 
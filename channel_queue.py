@@ -0,0 +1,65 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+
+class ChannelQueue:
+    """
+    First come, first served turns per channel. Waiters are woken by resolving their
+    future when the previous turn ends, and a channel's state is dropped as soon as
+    nobody holds or waits for its turn.
+    """
+
+    def __init__(self) -> None:
+        # A channel is present while its turn is held; the deque holds its waiters.
+        self._waiters: dict[int, deque[asyncio.Future]] = {}
+        self.waits = 0
+
+    def busy(self, channel_id: int) -> bool:
+        return channel_id in self._waiters
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, channel_id: int) -> None:
+        if (waiters := self._waiters.get(channel_id)) is None:
+            self._waiters[channel_id] = deque()
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        self.waits += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if future in waiters:
+                    waiters.remove(future)
+            else:
+                # The turn was handed over just as the waiter was cancelled.
+                self.release(channel_id)
+            raise
+
+    def release(self, channel_id: int) -> None:
+        waiters = self._waiters[channel_id]
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        del self._waiters[channel_id]
+
+    @asynccontextmanager
+    async def turn(self, channel_id: int) -> AsyncIterator[None]:
+        await self.acquire(channel_id)
+        try:
+            yield
+        finally:
+            self.release(channel_id)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "busy_channels": len(self._waiters),
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "waits": self.waits,
+        }
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import os
 import re
 import string
 import time
@@ -105,7 +106,12 @@ async def convert_to_possible_locations(
     locations: LocationsContainer = ctx.bot.locations
 
     if initial is None:
-        possible_locations = [await locations.random_location()]
+        # RANDOM_LOCATION_WEIGHT can be "population" or "kind"; uniform if unset.
+        possible_locations = [
+            await locations.random_location(
+                weight=os.environ.get("RANDOM_LOCATION_WEIGHT") or None
+            )
+        ]
         await ctx.send(
             f"Random location chosen: {possible_locations[0].name}", silent=True
         )
@@ -35,6 +35,15 @@ class FormatSettings(commands.Cog):
 
         return is_markdown
 
+    def is_embed(self, channel: discord.TextChannel | discord.DMChannel) -> bool:
+        if isinstance(channel, discord.TextChannel):
+            guild_id = channel.guild.id
+        else:
+            guild_id = channel.id
+        is_embed = self.guild_settings.get(guild_id, {}).get("is_embed", False)
+
+        return is_embed
+
     @app_commands.command(
         description="Provide a True/False argument to set whether the message should be summarised.",
     )
@@ -85,6 +94,29 @@ class FormatSettings(commands.Cog):
             f"Markdown message formatting set to: {argument}", silent=True
         )
 
+    @app_commands.command(
+        description="Provide a True/False argument to set whether the message should be packed into "
+        "embeds.",
+    )
+    async def embed(
+        self,
+        interaction: discord.Interaction,
+        argument: bool,
+    ) -> None:
+        if isinstance(interaction.channel, discord.TextChannel):
+            guild_id = interaction.channel.guild.id
+        elif isinstance(interaction.channel, discord.DMChannel):
+            guild_id = interaction.channel.id
+        else:
+            raise NotImplementedError
+        self.guild_settings[guild_id] = self.guild_settings.get(
+            guild_id, {"is_summary": True, "is_markdown": True}
+        )
+        self.guild_settings[guild_id]["is_embed"] = argument
+        await interaction.response.send_message(
+            f"Embed message formatting set to: {argument}", silent=True
+        )
+
 
 async def setup(bot: "MyBot"):
     await bot.add_cog(FormatSettings(bot))
@@ -1,6 +1,9 @@
 import asyncio
 import logging
+import os
 import random
+from collections.abc import AsyncIterable
+from contextlib import aclosing
 from io import BytesIO
 from typing import TYPE_CHECKING, Callable
 
@@ -8,13 +11,30 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from channel_queue import ChannelQueue
+from create_reply import (
+    IMAGE_FILENAME,
+    EmbedMessage,
+    continue_text,
+    iter_embed_messages,
+)
 from locations_container import Location, LocationsContainer
+from page_model import Page
+from send_scheduler import send_scheduler
+from work_pool import INTERACTION, PASSIVE, JobShed, work_pool
 
 if TYPE_CHECKING:
     from bot import MyBot
 
 logger = logging.getLogger(__name__)
 
+# Seconds a passive mention may wait for a worker before its reply is dropped.
+MESSAGE_DEADLINE = float(os.environ.get("MESSAGE_DEADLINE", 30))
+# Discord drops interactions not acknowledged within INTERACTION_DEADLINE seconds, so
+# they are deferred when the estimated work would take them past INTERACTION_BUDGET.
+INTERACTION_DEADLINE = 3
+INTERACTION_BUDGET = float(os.environ.get("INTERACTION_BUDGET", 2))
+
 
 async def setup(bot: "MyBot"):
     while not isinstance(bot.get_cog("FormatSettings"), commands.Cog):
@@ -23,14 +43,21 @@ async def setup(bot: "MyBot"):
 
 
 async def send_chunks(
-    channel: discord.TextChannel | discord.DMChannel, chunks: list[str | bytes]
+    channel: discord.TextChannel | discord.DMChannel,
+    chunks: AsyncIterable[str | bytes],
 ):
-    for chunk in chunks:
+    async for chunk in chunks:
         if isinstance(chunk, bytes):
-            await channel.send(file=discord.File(BytesIO(chunk), "location.png"), silent=True)  # type: ignore
+            await send_scheduler.send(channel, file=discord.File(BytesIO(chunk), "location.png"), silent=True)  # type: ignore
         elif isinstance(chunk, str):
-            await channel.send(chunk, silent=True)
-        await asyncio.sleep(0.5)
+            await send_scheduler.send(channel, chunk, silent=True)
+
+
+def embed_kwargs(message: EmbedMessage) -> dict:
+    kwargs = {"embeds": [discord.Embed.from_dict(embed) for embed in message.embeds]}
+    if message.image is not None:
+        kwargs["file"] = discord.File(BytesIO(message.image), IMAGE_FILENAME)
+    return kwargs
 
 
 async def send_greetings(message: discord.Message, possible_locations: list[Location]):
@@ -53,42 +80,84 @@ async def send_greetings(message: discord.Message, possible_locations: list[Loca
     await message.reply(found_locations_str, mention_author=False)
 
 
+def interaction_age(interaction: discord.Interaction) -> float:
+    return (discord.utils.utcnow() - interaction.created_at).total_seconds()
+
+
 class Message(commands.Cog):
     def __init__(self, bot: "MyBot"):
         self.bot: commands.Bot = bot
-        self.locations: LocationsContainer = bot.locations
         if not isinstance(cog := bot.get_cog("FormatSettings"), commands.Cog):
             raise Exception
         self.format_cog: commands.Cog = cog
         self.reply_locations: dict[int, list[Location]] = {}
         self.current_messages: dict[int, asyncio.Task] = {}
-        self.finding_locations: dict[int, bool] = {}
-        self.queue_count: dict[int, int] = {}
-        self.queue_at: dict[int, int] = {}
+        # Finding locations takes turns per channel, until the reply starts sending.
+        self.channel_queue = ChannelQueue()
+        self.interactions = 0
+        self.deferred = 0
+        self.deadline_misses = 0
 
-    async def cancel_message(self, channel: discord.TextChannel | discord.DMChannel):
-        if self.finding_locations.get(channel.id):
-            self.queue_at[channel.id] = self.queue_at.get(channel.id, 0)
-            queue_number = self.queue_count.get(channel.id, 0)
-            self.queue_count[channel.id] = queue_number + 1
-            while (
-                self.finding_locations.get(channel.id)
-                or queue_number != self.queue_at[channel.id]
-            ):
-                await asyncio.sleep(0.5)
-            self.queue_at[channel.id] += 1
-            if self.queue_at[channel.id] == self.queue_count[channel.id]:
-                del self.queue_at[channel.id]
-                del self.queue_count[channel.id]
-
-        self.finding_locations[channel.id] = True
-
-        if current_task := self.current_messages.get(channel.id):
+    @property
+    def locations(self) -> LocationsContainer:
+        # The bot swaps in a new index after each refresh.
+        return getattr(self.bot, "locations")
+
+    async def cancel_reply(self, channel: discord.TextChannel | discord.DMChannel):
+        if current_task := self.current_messages.pop(channel.id, None):
             current_task.cancel()
-            del self.current_messages[channel.id]
-            await asyncio.sleep(0.5)
-            await channel.send("== MESSAGE CANCELLED ==")
-            await asyncio.sleep(0.5)
+            await send_scheduler.send(channel, "== MESSAGE CANCELLED ==")
+
+    async def cancel_message(self, channel: discord.TextChannel | discord.DMChannel):
+        async with self.channel_queue.turn(channel.id):
+            await self.cancel_reply(channel)
+
+    def acknowledged(self, interaction: discord.Interaction):
+        self.interactions += 1
+        if (age := interaction_age(interaction)) > INTERACTION_DEADLINE:
+            self.deadline_misses += 1
+            logger.info(f"Interaction {interaction.id} acknowledged after {age:.1f}s.")
+
+    async def respond(self, interaction: discord.Interaction, *args, **kwargs):
+        """Send a message in reply to an interaction, acknowledging it if need be."""
+        if interaction.response.is_done():
+            await interaction.followup.send(*args, **kwargs)
+        else:
+            self.acknowledged(interaction)
+            await interaction.response.send_message(*args, **kwargs)
+
+    async def defer_if_slow(self, interaction: discord.Interaction, location: Location):
+        """Defer the interaction if fetching the location's page may miss its deadline."""
+        if interaction.response.is_done():
+            return
+        if (location.link, "page") in location.cache:
+            estimate = 0.0
+        else:
+            estimate = work_pool.estimate(INTERACTION)
+        if interaction_age(interaction) + estimate > INTERACTION_BUDGET:
+            self.acknowledged(interaction)
+            self.deferred += 1
+            await interaction.response.defer(thinking=True)
+
+    def interaction_stats(self) -> dict[str, int]:
+        return {
+            "interactions": self.interactions,
+            "deferred": self.deferred,
+            "deadline_misses": self.deadline_misses,
+        }
+
+    def start_reply(
+        self,
+        channel: discord.TextChannel | discord.DMChannel,
+        possible_locations: list[Location],
+    ):
+        if not isinstance(current_task := asyncio.current_task(), asyncio.Task):
+            raise NotImplementedError("Current task is not defined.")
+        self.current_messages[channel.id] = current_task
+        if len(possible_locations) > 1:
+            self.reply_locations[channel.id] = possible_locations[1:]
+        else:
+            self.reply_locations.pop(channel.id, None)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -96,23 +165,38 @@ class Message(commands.Cog):
             return
         if not isinstance(message.channel, (discord.DMChannel, discord.TextChannel)):
             raise NotImplementedError("Not DM or text channel.")
+        deadline = work_pool.clock() + MESSAGE_DEADLINE
 
-        await self.cancel_message(message.channel)
+        async with self.channel_queue.turn(message.channel.id):
+            await self.cancel_reply(message.channel)
 
-        possible_locations = await self.locations.get_possible_locations(
-            message.content
-        )
+            try:
+                possible_locations = await self.locations.get_possible_locations(
+                    message.content
+                )
+            except JobShed as e:
+                logger.info(f"Dropped message in {message.channel.id}: {e}")
+                return
 
-        # Send location info
-        if not possible_locations:
-            self.finding_locations[message.channel.id] = False
-            return
-        emoji = "👀"
-        await message.add_reaction(emoji)
+            # Send location info
+            if not possible_locations:
+                return
+            emoji = "👀"
+            await message.add_reaction(emoji)
+
+            try:
+                await send_greetings(message, possible_locations)
+            except Exception as e:
+                logger.error(e)
+                return
+            self.start_reply(message.channel, possible_locations)
 
         try:
-            await send_greetings(message, possible_locations)
-            await self.send_location_info(message.channel, possible_locations)
+            await self.send_location_info(
+                message.channel, possible_locations, deadline=deadline, priority=PASSIVE
+            )
+        except JobShed as e:
+            logger.info(f"Dropped reply in {message.channel.id}: {e}")
         except Exception as e:
             logger.error(e)
 
@@ -125,24 +209,21 @@ class Message(commands.Cog):
             interaction.channel, (discord.DMChannel, discord.TextChannel)
         ):
             raise NotImplementedError("Not DM or text channel.")
-        if self.finding_locations.get(
+        if self.channel_queue.busy(interaction.channel.id) or self.current_messages.get(
             interaction.channel.id
-        ) or self.current_messages.get(interaction.channel.id):
-            await interaction.response.send_message("Continuing...", silent=True)
-        await self.cancel_message(interaction.channel)
-        if not self.reply_locations.get(interaction.channel.id):
-            if interaction.response.is_done():
-                await interaction.followup.send("No locations to continue.", silent=True)
-            else:
-                await interaction.response.send_message("No locations to continue.", silent=True)
-            self.finding_locations[interaction.channel.id] = False
-            return
+        ):
+            await self.respond(interaction, "Continuing...", silent=True)
+        async with self.channel_queue.turn(interaction.channel.id):
+            await self.cancel_reply(interaction.channel)
+            if not self.reply_locations.get(interaction.channel.id):
+                await self.respond(
+                    interaction, "No locations to continue.", silent=True
+                )
+                return
 
-        await asyncio.sleep(
-            0.5
-        )  # Prevent !continue from triggering before on_message and cancelling
+            reply_locations = self.reply_locations[interaction.channel.id]
+            self.start_reply(interaction.channel, reply_locations)
 
-        reply_locations = self.reply_locations[interaction.channel.id]
         await self.send_location_info(
             interaction.channel,
             reply_locations,
@@ -154,16 +235,32 @@ class Message(commands.Cog):
         channel: discord.DMChannel | discord.TextChannel,
         possible_locations: list[Location],
         interaction: None | discord.Interaction = None,
+        deadline: None | float = None,
+        priority: int = INTERACTION,
     ):
         if not possible_locations:
             raise Exception("Empty possible_locations.")
-        if not isinstance(current_task := asyncio.current_task(), asyncio.Task):
-            raise NotImplementedError("Current task is not defined.")
-        self.current_messages[channel.id] = current_task
-        self.reply_locations[channel.id] = possible_locations[1:]
-        self.finding_locations[channel.id] = False
+        if self.current_messages.get(channel.id) is not asyncio.current_task():
+            self.start_reply(channel, possible_locations)
+        try:
+            await self.send_reply(
+                channel, possible_locations, interaction, deadline, priority
+            )
+        finally:
+            if self.current_messages.get(channel.id) is asyncio.current_task():
+                del self.current_messages[channel.id]
 
+    async def send_reply(
+        self,
+        channel: discord.DMChannel | discord.TextChannel,
+        possible_locations: list[Location],
+        interaction: None | discord.Interaction = None,
+        deadline: None | float = None,
+        priority: int = INTERACTION,
+    ):
         location = possible_locations[0]
+        if interaction is not None:
+            await self.defer_if_slow(interaction, location)
         if not isinstance(
             summary := getattr(self.format_cog, "is_summary"), Callable
         ) or not isinstance(
@@ -172,20 +269,73 @@ class Message(commands.Cog):
             raise Exception
         is_summary = summary(channel)
         is_markdown = markdown(channel)
+        is_embed = isinstance(
+            embed := getattr(self.format_cog, "is_embed", None), Callable
+        ) and embed(channel)
+        # Fetching the page and image is the expensive part, so it waits for a worker.
+        # The reply then uses what the job returns, whether or not the cache kept it. An
+        # uncached page comes back as its lead, with the rest still being extracted.
+        page, image, rest = await work_pool.run(
+            location.get_reply_page,
+            is_markdown or is_embed,
+            deadline=deadline,
+            priority=priority,
+        )
         if len(possible_locations) > 1:
             continue_location = possible_locations[1].name
             if continue_location is None:
                 raise Exception("Location's name was undefined.")
         else:
             continue_location = ""
-        reply = await location.get_reply_chunks(
-            is_summary, is_markdown, continue_location
-        )
+        if is_embed:
+            await self.send_location_embeds(
+                channel,
+                location,
+                page,
+                is_summary,
+                continue_location,
+                interaction,
+                image,
+                rest,
+            )
+            return
+        # Each chunk is sent as soon as it is rendered; cancelling this task stops both.
+        async with aclosing(
+            location.iter_reply_chunks(
+                page, is_summary, is_markdown, continue_location, image, rest
+            )
+        ) as reply:
+            if interaction is not None:
+                title = await anext(reply)
+                await self.respond(interaction, title, silent=True)
+            await send_chunks(channel, reply)
 
-        if interaction is not None:
-            if interaction.response.is_done():
-                await interaction.followup.send(reply.pop(0), silent=True)
-            else:
-                await interaction.response.send_message(reply.pop(0), silent=True)
-        await send_chunks(channel, reply)
-        del self.current_messages[channel.id]
+    async def send_location_embeds(
+        self,
+        channel: discord.DMChannel | discord.TextChannel,
+        location: Location,
+        page: Page,
+        is_summary: bool,
+        continue_location: str,
+        interaction: None | discord.Interaction = None,
+        image: None | bytes = None,
+        rest: None | asyncio.Future[Page] = None,
+    ):
+        # Embed descriptions are rendered as markdown, so the markdown reply is packed.
+        footer = continue_text(continue_location) if continue_location else ""
+        async with aclosing(
+            location.iter_reply_chunks(page, is_summary, True, image=image, rest=rest)
+        ) as reply:
+            async with aclosing(
+                iter_embed_messages(reply, location.link, footer)
+            ) as messages:
+                async for message in messages:
+                    if interaction is not None:
+                        await self.respond(
+                            interaction, **embed_kwargs(message), silent=True
+                        )
+                        interaction = None
+                    else:
+                        await send_scheduler.send(
+                            channel, **embed_kwargs(message), silent=True
+                        )
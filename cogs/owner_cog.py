@@ -5,6 +5,11 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from fetch_wiki import single_flight
+from page_cache import page_cache, render_cache
+from send_scheduler import send_scheduler
+from work_pool import work_pool
+
 if TYPE_CHECKING:
     from bot import MyBot
 
@@ -31,6 +36,41 @@ class Owner(commands.Cog):
         await interaction.response.send_message("Shutting down", silent=True)
         await self.bot.close()
 
+    @app_commands.command()
+    @commands.is_owner()
+    async def refresh(self, interaction: discord.Interaction):
+        await interaction.response.defer(thinking=True)
+        if await self.bot.refresh_locations():
+            message = f"Refreshed locations: {self.bot.locations}"
+        else:
+            message = "Locations are up to date"
+        logger.info(message)
+        if (report := self.bot.refresher.last_report) is not None:
+            message += "\n" + report.summary()
+        await interaction.followup.send(message[:2000], silent=True)
+
+    @app_commands.command()
+    @commands.is_owner()
+    async def stats(self, interaction: discord.Interaction):
+        sections = [
+            ("Page cache", page_cache.stats()),
+            ("Render cache", render_cache.stats()),
+            ("Fetches", single_flight.stats()),
+            ("Sends", send_scheduler.stats()),
+            ("Message work", work_pool.stats()),
+            ("Matcher", self.bot.locations.matcher.stats()),
+            ("Index refresh", self.bot.refresher.stats()),
+        ]
+        if (message_cog := self.bot.get_cog("Message")) is not None:
+            sections.append(("Channel turns", message_cog.channel_queue.stats()))
+            sections.append(("Interactions", message_cog.interaction_stats()))
+        lines = [
+            f"{label}: " + ", ".join(f"{name}={value}" for name, value in stats.items())
+            for label, stats in sections
+        ]
+        logger.info("; ".join(lines))
+        await interaction.response.send_message("\n".join(lines), silent=True)
+
 
 async def setup(bot: "MyBot"):
     await bot.add_cog(Owner(bot))
@@ -1,144 +1,180 @@
-from typing import TYPE_CHECKING, Callable
-
-from bs4 import BeautifulSoup, Tag
-
-from bs4_tools import markdown_from_tag, str_from_tag
-
-if TYPE_CHECKING:
-    from locations_container import Location
-
-
-async def get_title(
-    soup: BeautifulSoup,
-    convert_tag: Callable,
-    **convert_tag_kwargs,
-) -> str:
-    return convert_tag(soup.find("h1"), **convert_tag_kwargs)
-
-
-async def get_summary(
-    soup: BeautifulSoup,
-    convert_tag: Callable,
-    **convert_tag_kwargs,
-) -> str:
-    content = soup.find("div", id="mw-content-text")
-    if not isinstance(content, Tag):
-        raise Exception("Expected Tag object.")
-    tags = [
-        tag
-        for tag in content.find_all(["p", "h2", "h3"])
-        if not any(parent.name == "table" for parent in tag.parents)
-    ]
-    text = ""
-    for tag in tags:
-        if tag.name != "p":
-            break
-        tag_text = convert_tag(tag, **convert_tag_kwargs)
-        if not tag_text:
-            continue
-        text += f"{tag_text}\n\n"
-
-    return text.rstrip()
-
-
-async def get_content(
-    soup: BeautifulSoup,
-    convert_tag: Callable,
-    **convert_tag_kwargs,
-) -> str:
-    content = soup.find("div", id="mw-content-text")
-    if not isinstance(content, Tag):
-        raise Exception("Expected Tag object.")
-    tags = content.find_all(["p", "h2", "h3", "ul", "ol"])
-
-    text = ""
-    for tag in tags:
-        tag_text = convert_tag(tag, **convert_tag_kwargs)
-        if not tag_text or any(parent.name == "table" for parent in tag.parents):
-            continue
-        if any(
-            phrase in tag_text.lower()
-            for phrase in ["see also", "notes", "references", "external links"]
+import asyncio
+import re
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator
+from dataclasses import dataclass, field
+
+from page_model import LineRenderer, Page
+
+# Discord's limits on embeds, per embed and per message.
+EMBED_TITLE_LIMIT = 256
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_FOOTER_LIMIT = 2048
+MESSAGE_EMBEDS_LIMIT = 10
+MESSAGE_EMBED_CHARS_LIMIT = 6000
+IMAGE_FILENAME = "location.png"
+
+
+def iter_line_chunks(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        for chunk in into_chunks(line, 2000):
+            yield chunk if chunk else "_ _"
+
+
+def iter_render_chunks(
+    page: Page, is_summary: bool, is_markdown: bool
+) -> Iterator[str]:
+    """
+    Yield the title followed by the text chunks of a reply, each as soon as it is
+    rendered. The image and the continue footer are added by the caller so that the
+    result can be cached.
+    """
+    yield page.get_title(is_markdown)
+    yield from iter_line_chunks(page.iter_lines(is_summary, is_markdown))
+
+
+async def iter_stream_chunks(
+    page: Page,
+    is_summary: bool,
+    is_markdown: bool,
+    rest: None | asyncio.Future[Page] = None,
+) -> AsyncIterator[str]:
+    """
+    Yield the same chunks as iter_render_chunks. page may be only the lead of the
+    article (see extract_page), with rest the whole page still being extracted: the
+    title and the lead's chunks are then yielded first, and the rest is only awaited
+    for the content after the lead. Summaries never wait for it.
+    """
+    if rest is None or is_summary:
+        for chunk in iter_render_chunks(page, is_summary, is_markdown):
+            yield chunk
+        return
+
+    yield page.get_title(is_markdown)
+    renderer = LineRenderer(is_summary, is_markdown)
+    for block in page.blocks:
+        for chunk in iter_line_chunks(renderer.add(block)):
+            yield chunk
+    if not renderer.ended:
+        # Shielded, so that cancelling a reply leaves the page to the others awaiting it.
+        for block in (await asyncio.shield(rest)).blocks[len(page.blocks) :]:
+            for chunk in iter_line_chunks(renderer.add(block)):
+                yield chunk
+    for chunk in iter_line_chunks(renderer.finish()):
+        yield chunk
+
+
+async def iter_chunks(chunks: Iterable[str]) -> AsyncIterator[str]:
+    for chunk in chunks:
+        yield chunk
+
+
+def continue_text(continue_location: str) -> str:
+    return f"Type /continue for information on {continue_location}, another location in your message."
+
+
+def continue_chunks(continue_location: str = "") -> list[str]:
+    if not continue_location:
+        return []
+    return ["_ _", continue_text(continue_location)]
+
+
+@dataclass
+class EmbedMessage:
+    """One message of up to MESSAGE_EMBEDS_LIMIT embeds, given as Discord embed dicts."""
+
+    embeds: list[dict] = field(default_factory=list)
+    image: bytes | None = None
+    chars: int = 0
+
+
+class EmbedPacker:
+    """
+    Bin-packs a reply's title, image and text chunks into as few messages as Discord's
+    embed limits allow: lines are joined into descriptions, and descriptions into
+    messages of up to ten embeds and MESSAGE_EMBED_CHARS_LIMIT characters.
+    """
+
+    def __init__(self, title: str, url: str, image: bytes | None = None) -> None:
+        title = title[:EMBED_TITLE_LIMIT]
+        embed: dict = {"title": title, "url": url}
+        if image is not None:
+            embed["image"] = {"url": f"attachment://{IMAGE_FILENAME}"}
+        self.message = EmbedMessage([embed], image, len(title))
+
+    def add(self, chunk: str) -> EmbedMessage | None:
+        """Add a text chunk, returning the previous message if this one didn't fit."""
+        line = "" if chunk == "_ _" else chunk
+        embed = self.message.embeds[-1]
+        description = embed.get("description")
+        added = len(line) if description is None else len(line) + 1
+        if (
+            len(description or "") + added <= EMBED_DESCRIPTION_LIMIT
+            and self.message.chars + added <= MESSAGE_EMBED_CHARS_LIMIT
         ):
-            # Parse only main content
-            break
-        if tag.name == "p":
-            text += f"{tag_text}\n\n"
-        elif tag.name in ["ul", "ol", "menu"]:
-            text = f"{text.rstrip()}\n{tag_text}\n\n"
+            embed["description"] = (
+                line if description is None else f"{description}\n{line}"
+            )
+            self.message.chars += added
+            return None
+        if (
+            len(self.message.embeds) < MESSAGE_EMBEDS_LIMIT
+            and self.message.chars + len(line) <= MESSAGE_EMBED_CHARS_LIMIT
+        ):
+            self.message.embeds.append({"description": line})
+            self.message.chars += len(line)
+            return None
+
+        full_message = self.message
+        self.message = EmbedMessage([{"description": line}], chars=len(line))
+        return clean_message(full_message)
+
+    def finish(self, footer: str = "") -> list[EmbedMessage]:
+        """Return the remaining messages, with footer on the last embed."""
+        footer = footer[:EMBED_FOOTER_LIMIT]
+        messages = [self.message]
+        if footer:
+            if self.message.chars + len(footer) <= MESSAGE_EMBED_CHARS_LIMIT:
+                self.message.embeds[-1]["footer"] = {"text": footer}
+            else:
+                messages.append(EmbedMessage([{"description": footer}]))
+
+        return [clean_message(message) for message in messages]
+
+
+def clean_message(message: EmbedMessage) -> EmbedMessage:
+    """Strip blank lines around descriptions and drop embeds left empty."""
+    for embed in message.embeds:
+        if description := embed.pop("description", "").strip("\n"):
+            embed["description"] = description
+    message.embeds = [embed for embed in message.embeds if embed]
+
+    return message
+
+
+async def iter_embed_messages(
+    chunks: AsyncIterable[str | bytes], url: str, footer: str = ""
+) -> AsyncIterator[EmbedMessage]:
+    """
+    Pack the markdown reply chunks of a location (title, image, text) into embed
+    messages, yielding each message as soon as it is full.
+    """
+    title = None
+    image = None
+    packer = None
+    async for chunk in chunks:
+        if title is None:
+            title = re.sub(r"^#+ ", "", str(chunk))
+        elif isinstance(chunk, bytes):
+            image = chunk
         else:
-            text += f"{tag_text}\n"
-
-    return text.rstrip()
-
-
-async def return_markdown_reply_chunks(
-    location: "Location",
-    is_summary: bool = True,
-    continue_location: str = "",
-) -> list[str | bytes]:
-    soup = location.soup
-    image = location.image
-    if soup is None or image is None:
-        raise Exception(f"Soup properties of {location} have not been retrieved")
-    title = await get_title(
-        soup,
-        markdown_from_tag,
-        url=location.link,
-        url_domain="https://en.wikipedia.org",
-    )
-
-    if is_summary:
-        text = await get_summary(
-            soup,
-            markdown_from_tag,
-            url=location.link,
-            url_domain="https://en.wikipedia.org",
-        )
-    else:
-        text = await get_content(
-            soup,
-            markdown_from_tag,
-            url=location.link,
-            url_domain="https://en.wikipedia.org",
-        )
-
-    reply_chunks = (
-        [title]
-        + [image]
-        + [chunk if chunk else "_ _" for chunk in into_chunks(text, 2000)]
-    )
-    if continue_location:
-        reply_chunks += [
-            "_ _",
-            f"Type /continue for information on {continue_location}, another location in your message.",
-        ]
-
-    return reply_chunks
-
-
-async def return_reply_chunks(
-    location: "Location", is_summary: bool = True, continue_location: str = ""
-) -> list[str]:
-    soup = location.soup
-    if soup is None:
-        raise Exception(f"Soup properties of {location} have not been retrieved")
-
-    title = await get_title(soup, str_from_tag)
-    if is_summary:
-        text = await get_summary(soup, str_from_tag)
-    else:
-        text = await get_content(soup, str_from_tag)
-    reply_chunks = [title] + [
-        chunk if chunk else "_ _" for chunk in into_chunks(text, 2000)
-    ]
-    if continue_location:
-        reply_chunks += [
-            "_ _",
-            f"Type /continue for information on {continue_location}, another location in your message.",
-        ]
-
-    return reply_chunks
+            if packer is None:
+                packer = EmbedPacker(title, url, image)
+            if message := packer.add(chunk):
+                yield message
+    if packer is None:
+        packer = EmbedPacker(title or "", url, image)
+    for message in packer.finish(footer):
+        yield message
 
 
 def find_last(initial_string: str, substr: str) -> int:
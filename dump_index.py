@@ -0,0 +1,274 @@
+import asyncio
+import bz2
+import gzip
+import html
+import json
+import logging
+import logging.config
+import re
+import time
+from collections.abc import Iterator
+from functools import partial
+from typing import IO
+from urllib.parse import quote
+from xml.etree.ElementTree import iterparse
+
+from fetch_wiki import parse_soup
+from locations_container import LocationsContainer, combine
+from locations_from_wiki import (
+    CITIES_LINK,
+    CONTINENT_COLUMNS,
+    CONTINENTS_LINK,
+    COUNTRIES_LINK,
+    COUNTRY_COLUMNS,
+    country_page_links,
+    page_title,
+    parse_city_tables,
+    parse_continent_table,
+    parse_country_table,
+)
+
+logger = logging.getLogger(__name__)
+
+CITY_PAGES_PREFIX = page_title(CITIES_LINK) + "/country"
+LIST_PAGE_PARSERS = {
+    COUNTRIES_LINK: partial(parse_country_table, column_select=COUNTRY_COLUMNS),
+    CONTINENTS_LINK: partial(parse_continent_table, column_select=CONTINENT_COLUMNS),
+}
+LIST_PAGE_TITLES = {page_title(link) for link in [CITIES_LINK, *LIST_PAGE_PARSERS]}
+
+HEADING = re.compile(r"(={2,6})\s*(.*?)\s*\1")
+WIKI_LINK = re.compile(r"\[\[([^\[\]|]*)(?:\|([^\[\]]*))?\]\]")
+EXTERNAL_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]+ ?([^\]]*)\]")
+TEMPLATE = re.compile(r"\{\{([^{}]*)\}\}")
+REFERENCE = re.compile(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>|<!--.*?-->", re.DOTALL)
+EMPHASIS = re.compile(r"'{2,5}")
+
+
+def wiki_path(title: str) -> str:
+    """Return the path of a page title, escaped like MediaWiki does."""
+    return "/wiki/" + quote(title.replace(" ", "_"), safe=";@$!*(),/~:")
+
+
+def wiki_link(title: str) -> str:
+    return "https://en.wikipedia.org" + wiki_path(title)
+
+
+def open_dump(path: str) -> IO[bytes]:
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_xml_pages(file: IO[bytes]) -> Iterator[tuple[str, str]]:
+    """
+    Yield the title and wikitext of the article pages of a MediaWiki XML export (such
+    as pages-articles.xml). Each page is dropped from the tree once read, so memory use
+    does not grow with the dump.
+    """
+    events = iterparse(file, events=("start", "end"))
+    _, root = next(events)
+    title = namespace = text = None
+    for event, element in events:
+        if event != "end":
+            continue
+        tag = element.tag.rpartition("}")[2]
+        if tag == "title":
+            title = element.text
+        elif tag == "ns":
+            namespace = element.text
+        elif tag == "text":
+            text = element.text
+        elif tag == "page":
+            if namespace == "0" and title and text:
+                yield title, text
+            title = namespace = text = None
+            root.clear()
+
+
+def iter_json_pages(file: IO[bytes]) -> Iterator[tuple[str, str]]:
+    """
+    Yield the title and HTML of the article pages of a JSON lines export: one object
+    per line with a "name" (or "title") and an "article_body": {"html": ...} (or
+    "html"), like the Wikimedia Enterprise HTML dumps.
+    """
+    for line in file:
+        if not line.strip():
+            continue
+        page = json.loads(line)
+        if page.get("namespace", {}).get("identifier", 0) != 0:
+            continue
+        title = page.get("name") or page.get("title")
+        body = page.get("article_body", {}).get("html") or page.get("html")
+        if title and body:
+            yield title, body
+
+
+def _template(match: re.Match) -> str:
+    name, *params = [param.strip() for param in match[1].split("|")]
+    name = name.lower()
+    if name.startswith("formatnum:"):
+        number = match[1].split(":", 1)[1].strip()
+        return f"{int(number):,}" if number.isdigit() else number
+    if name in ("flag", "flagcountry", "flagu") and params:
+        return f"[[{params[0]}]]"
+    if name in ("sort", "nts", "ntsh") and params:
+        return params[-1]
+    return ""
+
+
+def _wiki_link(match: re.Match) -> str:
+    target, label = match[1].strip(), match[2]
+    page = target.split("#")[0].strip().replace("_", " ")
+    if ":" in page and page.split(":")[0].lower() in ("file", "image", "category"):
+        return ""
+    if label is None:
+        label = target
+    if not page:
+        return label
+    page = page[0].upper() + page[1:]
+    return f'<a href="{wiki_path(page)}" title="{html.escape(page)}">{label}</a>'
+
+
+def render_inline(text: str) -> str:
+    """Turn links into anchors and drop references, comments and most templates."""
+    text = REFERENCE.sub("", text)
+    text = WIKI_LINK.sub(_wiki_link, text)
+    while True:
+        text, count = TEMPLATE.subn(_template, text)
+        if not count:
+            break
+    text = WIKI_LINK.sub(_wiki_link, text)
+    text = EXTERNAL_LINK.sub(r"\1", text)
+    return EMPHASIS.sub("", text)
+
+
+def _cell(cell: str) -> str:
+    """Return the content of a table cell, without its attributes."""
+    attributes, separator, content = cell.partition("|")
+    if separator and "=" in attributes:
+        return content.strip()
+    return cell.strip()
+
+
+def wikitext_html(text: str) -> str:
+    """
+    Return HTML with the headings and tables of wikitext, enough for the list page
+    parsers; everything else is dropped.
+    """
+    text = render_inline(text)
+    parts = []
+    row: None | list[list[str]] = None
+    depth = 0
+
+    def close_row() -> None:
+        if row:
+            parts.append(
+                "<tr>"
+                + "".join(f"<{tag}>{content}</{tag}>" for tag, content in row)
+                + "</tr>"
+            )
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("{|"):
+            depth += 1
+            parts.append(f"<table {line[2:].strip()}>")
+            row = None
+        elif not depth:
+            if heading := HEADING.fullmatch(line):
+                level = len(heading[1])
+                parts.append(f"<h{level}>{heading[2]}</h{level}>")
+        elif line.startswith("|}"):
+            close_row()
+            row = None
+            depth -= 1
+            parts.append("</table>")
+        elif line.startswith("|-"):
+            close_row()
+            row = []
+        elif line.startswith("|+"):
+            continue
+        elif line.startswith(("!", "|")):
+            tag, separators = ("th", r"!!|\|\|") if line[0] == "!" else ("td", r"\|\|")
+            row = row if row is not None else []
+            row += [[tag, _cell(cell)] for cell in re.split(separators, line[1:])]
+        elif row:
+            row[-1][1] += "\n" + line
+
+    return "".join(parts)
+
+
+def iter_dump_pages(path: str) -> Iterator[tuple[str, str, bool]]:
+    """
+    Yield the title, content and whether the content is HTML (rather than wikitext) of
+    each article page of an XML or JSON lines dump, optionally bz2 or gzip compressed.
+    """
+    name = path.removesuffix(".bz2").removesuffix(".gz")
+    if name.endswith(".xml"):
+        pages, is_html = iter_xml_pages, False
+    elif name.endswith((".json", ".jsonl", ".ndjson")):
+        pages, is_html = iter_json_pages, True
+    else:
+        raise ValueError(f"Unknown dump format: {path}")
+    with open_dump(path) as file:
+        for title, content in pages(file):
+            yield title, content, is_html
+
+
+def is_list_page(title: str) -> bool:
+    return title in LIST_PAGE_TITLES or title.startswith(CITY_PAGES_PREFIX)
+
+
+async def build_from_dump(path: str) -> LocationsContainer:
+    """
+    Return the index built from the list pages found in a dump file, the same as
+    create_locations builds it from the live pages. The dump is streamed, and only the
+    list pages are parsed.
+    """
+    start = time.perf_counter()
+    pages = 0
+    city_links = None
+    parsed: dict[str, LocationsContainer] = {}
+    for title, content, is_html in iter_dump_pages(path):
+        pages += 1
+        if not is_list_page(title):
+            continue
+        link = wiki_link(title)
+        soup = parse_soup(content if is_html else wikitext_html(content))
+        if link == CITIES_LINK:
+            city_links = country_page_links(soup)
+        elif link in LIST_PAGE_PARSERS:
+            parsed[link] = LIST_PAGE_PARSERS[link](soup)
+        else:
+            parsed[link] = parse_city_tables(soup)
+
+    # Combine in the same order as IndexRefresher.build: the country pages as the home
+    # page links them, then the countries and continents.
+    if not city_links:
+        city_links = sorted(link for link in parsed if link not in LIST_PAGE_PARSERS)
+    links = [*city_links, *LIST_PAGE_PARSERS]
+    found = [parsed[link] for link in links if link in parsed]
+    if not found:
+        raise ValueError(f"No list pages found in {path}.")
+    locations = combine(*found)
+    await asyncio.to_thread(locations.build_matcher)
+    logger.info(
+        f"Built {locations} from {len(found)} list pages of {path} "
+        f"({pages} pages) in {time.perf_counter() - start:.1f}s."
+    )
+    return locations
+
+
+if __name__ == "__main__":
+    import sys
+
+    with open("logging_config.json", "rt") as f:
+        config = json.load(f)
+    logging.config.dictConfig(config)
+
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python dump_index.py DUMP SNAPSHOT")
+    asyncio.run(build_from_dump(sys.argv[1])).save_snapshot(sys.argv[2])
@@ -1,34 +1,114 @@
+import asyncio
 import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
 
-from aiohttp import ClientSession
-from bs4 import BeautifulSoup, Tag
+from aiohttp import ClientResponseError
+from bs4 import BeautifulSoup
+
+from http_client import HttpClient, get_client
+from page_model import Page, extract_page
+from parse_pool import ParsePool, get_pool
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_soup(link: str, session: ClientSession) -> BeautifulSoup:
-    logger.info(f"Started fetching soup: {link}.")
-    async with session.get(link) as response:
-        soup = BeautifulSoup(await response.text(), "html.parser")
-    logger.info(f"Finished fetching soup {link}.")
+class SingleFlight:
+    """
+    Coalesces concurrent requests for the same key: while a fetch is in flight, later
+    callers await its result instead of starting their own.
+    """
 
-    return soup
+    def __init__(self) -> None:
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.coalesced = 0
 
+    async def run(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if (future := self._in_flight.get(key)) is None:
+            future = asyncio.ensure_future(fetch())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight fetch: {key}.")
+        # A cancelled caller must not cancel the fetch for the others.
+        return await asyncio.shield(future)
 
-async def fetch_image(soup: BeautifulSoup, session: ClientSession) -> bytes:
-    infobox = soup.find("table", class_="infobox")
-    if infobox is None:
-        raise Exception("No infobox table was found.")
-    img_tag = infobox.find("img")
-    if not isinstance(img_tag, Tag):
-        raise Exception("No image found.")
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self._in_flight), "coalesced": self.coalesced}
 
-    if not isinstance(src := img_tag["src"], str):
-        raise Exception("Image has no source.")
-    url = "https:" + src
-    async with session.get(url) as resp:
-        if resp.status != 200:
-            logger.info("Could not download file.")
-            raise Exception("Could not download file.")
-        else:
-            return await resp.read()
+
+single_flight = SingleFlight()
+
+
+async def fetch_html(link: str, client: HttpClient | None = None) -> str:
+    return await (client or get_client()).get_text(link)
+
+
+def parse_soup(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, "html.parser")
+
+
+async def fetch_page(
+    link: str,
+    client: HttpClient | None = None,
+    pool: ParsePool | None = None,
+    partial: bool = False,
+    html: None | str = None,
+) -> Page:
+    """
+    Fetch an article and extract its Page in the parse pool. Concurrent calls for the
+    same link share one download and parse. With partial, only the parts replies read
+    are parsed (see extract_page). html is the article if it was already downloaded.
+    """
+
+    async def fetch() -> Page:
+        logger.info(f"Started fetching page: {link}.")
+        page = await (pool or get_pool()).run(
+            extract_page, html or await fetch_html(link, client), link, partial
+        )
+        logger.info(f"Finished fetching page {link}.")
+        return page
+
+    return await single_flight.run(
+        f"page:{link}" + (":partial" if partial else ""), fetch
+    )
+
+
+async def fetch_page_lead(
+    link: str, client: HttpClient | None = None, pool: ParsePool | None = None
+) -> tuple[Page, asyncio.Task[Page]]:
+    """
+    Fetch an article and return the Page of its lead (see extract_page) as soon as it is
+    extracted, with a task extracting the Page fetch_page(partial=True) returns from the
+    same download. The lead is sent to the parse pool first, so it doesn't wait for the
+    whole page. Concurrent calls for the same link share the lead and the task.
+    """
+
+    async def fetch() -> tuple[Page, asyncio.Task[Page]]:
+        parse_pool = pool or get_pool()
+        html = await fetch_html(link, client)
+        lead = asyncio.ensure_future(
+            parse_pool.run(extract_page, html, link, True, True)
+        )
+        page = asyncio.ensure_future(fetch_page(link, client, parse_pool, True, html))
+        try:
+            return await lead, page
+        except BaseException:
+            page.cancel()
+            raise
+
+    return await single_flight.run(f"lead:{link}", fetch)
+
+
+async def fetch_image(page: Page, client: HttpClient | None = None) -> bytes:
+    if page.image_url is None:
+        raise Exception("No image found.")
+    url = page.image_url
+    try:
+        return await single_flight.run(
+            f"image:{url}", lambda: (client or get_client()).get_bytes(url)
+        )
+    except ClientResponseError:
+        logger.info("Could not download file.")
+        raise Exception("Could not download file.")
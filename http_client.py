@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+from collections.abc import Mapping
+from urllib.parse import urlsplit, urlunsplit
+
+from aiohttp import (
+    ClientError,
+    ClientResponseError,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+VALIDATOR_HEADERS = ("ETag", "Last-Modified")
+
+
+class HttpClient:
+    """
+    Bot-lifetime HTTP client: one pooled connection set with DNS caching, keep-alive,
+    compression, timeouts and retries with exponential backoff.
+
+    host_overrides maps an origin such as "https://en.wikipedia.org" to another one, e.g.
+    a local stand-in server, so that hard-coded Wikipedia links can be redirected.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 16,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff: float = 0.5,
+        host_overrides: dict[str, str] | None = None,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = ClientTimeout(total=timeout, sock_connect=10)
+        self.retries = retries
+        self.backoff = backoff
+        self.host_overrides = host_overrides or {}
+        self._session: ClientSession | None = None
+
+    @property
+    def session(self) -> ClientSession:
+        """The pooled session, created on first use inside the running event loop."""
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self._session = ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    "Accept-Encoding": "gzip, deflate",
+                    "User-Agent": "location-info-bot (Discord bot; aiohttp)",
+                },
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def resolve(self, url: str) -> str:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if (override := self.host_overrides.get(origin)) is not None:
+            new_parts = urlsplit(override)
+            return urlunsplit((new_parts.scheme, new_parts.netloc, *parts[2:]))
+        return url
+
+    async def _get(
+        self,
+        url: str,
+        as_text: bool,
+        headers: dict[str, str] | None = None,
+        retries: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[int, Mapping[str, str], str | bytes]:
+        """
+        GET url, retrying transient errors. retries and timeout (in seconds, in total)
+        override the client's own for this request.
+        """
+        url = self.resolve(url)
+        retries = self.retries if retries is None else retries
+        request_timeout = (
+            self.timeout
+            if timeout is None
+            else ClientTimeout(total=timeout, sock_connect=self.timeout.sock_connect)
+        )
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.get(
+                    url, headers=headers, timeout=request_timeout
+                ) as response:
+                    response.raise_for_status()
+                    if response.status == 304:
+                        body = "" if as_text else b""
+                    elif as_text:
+                        body = await response.text()
+                    else:
+                        body = await response.read()
+                    return response.status, response.headers, body
+            except (ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, ClientResponseError) or (
+                    e.status in RETRY_STATUSES
+                )
+                if not retryable or attempt == retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                logger.info(f"Retrying {url} in {delay}s after: {e!r}")
+                await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def get_text(self, url: str) -> str:
+        return (await self._get(url, as_text=True))[2]  # type: ignore
+
+    async def get_bytes(self, url: str) -> bytes:
+        return (await self._get(url, as_text=False))[2]  # type: ignore
+
+    async def get_text_if_modified(
+        self,
+        url: str,
+        validators: dict[str, str],
+        retries: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str | None, dict[str, str]]:
+        """
+        Conditional GET with the ETag and Last-Modified validators of an earlier
+        response. Returns None and the same validators if the page is unchanged,
+        otherwise its text and new validators. retries and timeout are as for _get.
+        """
+        headers = {}
+        if etag := validators.get("ETag"):
+            headers["If-None-Match"] = etag
+        if last_modified := validators.get("Last-Modified"):
+            headers["If-Modified-Since"] = last_modified
+        status, response_headers, text = await self._get(
+            url, True, headers, retries, timeout
+        )
+        if status == 304:
+            return None, validators
+        new_validators = {
+            name: response_headers[name]
+            for name in VALIDATOR_HEADERS
+            if name in response_headers
+        }
+        return text, new_validators  # type: ignore
+
+
+_client: HttpClient | None = None
+
+
+def get_client() -> HttpClient:
+    """Return the shared client, creating it from the environment on first use."""
+    global _client
+    if _client is None:
+        _client = HttpClient(
+            limit=int(os.environ.get("HTTP_CONNECTIONS", 100)),
+            limit_per_host=int(os.environ.get("HTTP_CONNECTIONS_PER_HOST", 16)),
+            timeout=float(os.environ.get("HTTP_TIMEOUT", 30)),
+        )
+    return _client
+
+
+def set_client(client: HttpClient) -> None:
+    """Replace the shared client, e.g. with one pointed at a local test server."""
+    global _client
+    _client = client
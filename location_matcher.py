@@ -0,0 +1,173 @@
+import logging
+import re
+from collections import deque
+from collections.abc import Iterable
+
+logger = logging.getLogger(__name__)
+
+# Runs of characters for which str.isalnum() is true.
+ALNUM_RUN = re.compile(r"[^\W_]+")
+
+
+class LocationMatcher:
+    """
+    Aho-Corasick automaton over the keys of a LocationsContainer.
+
+    A key is mentioned in a sentence when it is surrounded by whitespace, optionally
+    with punctuation in between, i.e. the same semantics as the regex
+    r"\\s[\\W_]*" + re.escape(key) + r"[\\W_]*\\s" on the sentence padded with spaces.
+
+    Since a mention can't be preceded or followed by an alphanumeric character, the
+    first alphanumeric run of a mentioned key is also a whole alphanumeric run of the
+    sentence. Sentences sharing no run with the first runs of the keys are rejected
+    before the automaton is run.
+    """
+
+    def __init__(self, keys: Iterable[str]) -> None:
+        self.keys: list[str] = []
+        self._goto: list[dict[str, int]] = [{}]
+        self._terminal: list[int] = [-1]
+        self._first_runs: set[str] = set()
+        self._always_scan = False
+        for key in keys:
+            if key:
+                self._insert(key)
+                if match := ALNUM_RUN.search(key):
+                    self._first_runs.add(match.group())
+                else:
+                    self._always_scan = True
+        self.checked = 0
+        self.rejected = 0
+        self._fail = [0] * len(self._goto)
+        self._output = [-1] * len(self._goto)
+        self._build_links()
+        logger.info(f"Built matcher with {len(self.keys)} keys.")
+
+    def _insert(self, key: str) -> None:
+        node = 0
+        for char in key:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._terminal.append(-1)
+            node = next_node
+        if self._terminal[node] == -1:
+            self._terminal[node] = len(self.keys)
+            self.keys.append(key)
+
+    def _build_links(self) -> None:
+        """Compute failure links and output (dictionary suffix) links breadth first."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0) if node else 0
+                self._fail[child] = fail
+                if self._terminal[fail] != -1:
+                    self._output[child] = fail
+                else:
+                    self._output[child] = self._output[fail]
+                queue.append(child)
+
+    def find_spans(self, sentence: str) -> list[tuple[int, int, int]]:
+        """
+        Return every (start, end, key index) mention in an already normalised sentence,
+        in a single pass over the sentence.
+        """
+        sentence = f" {sentence} "
+        length = len(sentence)
+
+        # left_ok[i]: whitespace is reached before any alphanumeric when scanning left of i
+        left_ok = [True] * (length + 1)
+        for i in range(1, length + 1):
+            char = sentence[i - 1]
+            if char.isspace():
+                left_ok[i] = True
+            elif char.isalnum():
+                left_ok[i] = False
+            else:
+                left_ok[i] = left_ok[i - 1]
+        # right_ok[j]: whitespace is reached before any alphanumeric when scanning from j
+        right_ok = [True] * (length + 1)
+        for j in range(length - 1, -1, -1):
+            char = sentence[j]
+            if char.isspace():
+                right_ok[j] = True
+            elif char.isalnum():
+                right_ok[j] = False
+            else:
+                right_ok[j] = right_ok[j + 1]
+
+        goto, fail, terminal, output = (
+            self._goto,
+            self._fail,
+            self._terminal,
+            self._output,
+        )
+        spans = []
+        node = 0
+        for i, char in enumerate(sentence):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if terminal[node] != -1 else output[node]
+            while match > 0:
+                key_id = terminal[match]
+                end = i + 1
+                start = end - len(self.keys[key_id])
+                # Boundary characters must not be part of the key itself.
+                if start > 0 and end < length and left_ok[start] and right_ok[end]:
+                    spans.append((start - 1, end - 1, key_id))
+                match = output[match]
+
+        return spans
+
+    def may_mention(self, sentence: str) -> bool:
+        """Return False if the sentence certainly mentions no key."""
+        self.checked += 1
+        if self._always_scan or not self._first_runs.isdisjoint(
+            ALNUM_RUN.findall(sentence)
+        ):
+            return True
+        self.rejected += 1
+        return False
+
+    def find(self, sentence: str, longest_match: bool = False) -> list[str]:
+        """
+        Return the keys mentioned in an already normalised sentence, in the order they
+        were given to the matcher. With longest_match, overlapping mentions are resolved
+        in favour of the longest one, e.g. "santa cruz province" hides "santa cruz".
+        """
+        if not self.may_mention(sentence):
+            return []
+        spans = self.find_spans(sentence)
+        if longest_match:
+            spans.sort(key=lambda span: (span[0], span[0] - span[1]))
+            kept = []
+            covered_until = -1
+            for start, end, key_id in spans:
+                if start >= covered_until:
+                    kept.append((start, end, key_id))
+                    covered_until = end
+                elif kept and end - start > kept[-1][1] - kept[-1][0]:
+                    kept[-1] = (start, end, key_id)
+                    covered_until = end
+            spans = kept
+
+        return [self.keys[key_id] for key_id in sorted({span[2] for span in spans})]
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "keys": len(self.keys),
+            "first_runs": len(self._first_runs),
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "reject_rate": (
+                round(self.rejected / self.checked, 3) if self.checked else 0
+            ),
+        }
@@ -1,30 +1,80 @@
 import asyncio
+import gzip
+import itertools
+import json
 import logging
+import os
 import random
 import re
-from collections.abc import Iterable
-from copy import deepcopy
+import sys
+import time
+from array import array
+from collections import Counter
+from collections.abc import AsyncIterator, Iterator
 
-from aiohttp import ClientSession
-from bs4 import BeautifulSoup, Tag
 from unidecode import unidecode
 
-from bs4_tools import str_from_tag
-from create_reply import return_markdown_reply_chunks, return_reply_chunks
-from fetch_wiki import fetch_image, fetch_soup
+from create_reply import continue_chunks, iter_chunks, iter_stream_chunks
+from fetch_wiki import fetch_image, fetch_page, fetch_page_lead
+from http_client import HttpClient
+from location_matcher import LocationMatcher
+from page_cache import PageCache, RenderCache, page_cache, render_cache
+from page_model import Page
+from work_pool import work_pool
 
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_VERSION = 4
+# Candidates for the same key are ranked by kind of place, then by population.
+KIND_RANKS = {"continent": 0, "country": 1, "city": 2, "state": 3}
+
+
+def parse_population(extra_info: dict[str, str]) -> None | int:
+    """Return the number in the first population column of a table row, if any."""
+    for column, value in extra_info.items():
+        if column.lower().startswith("population"):
+            if match := re.search(r"\d[\d,]*", re.sub(r"\[.*?\]", "", value)):
+                return int(match.group().replace(",", ""))
+    return None
+
+
+# Column name tuples shared by every location with the same table columns.
+_column_sets: dict[tuple[str, ...], tuple[str, ...]] = {}
+
+
+def intern_columns(columns: tuple[str, ...]) -> tuple[str, ...]:
+    columns = tuple(sys.intern(column) for column in columns)
+    return _column_sets.setdefault(columns, columns)
+
 
 class Location:
+    """
+    A place from the list tables. Instances have no __dict__, and extra_info is stored
+    as a tuple of values next to an interned tuple of column names.
+    """
+
+    __slots__ = ("key", "link", "name", "kind", "population", "_columns", "_values")
+
+    cache: PageCache = page_cache
+    render_cache: RenderCache = render_cache
+
     def __init__(self, link: str, key: str = "", **kwargs) -> None:
         self.key = key
         self.link = link
-        self.extra_info = {**kwargs}
+        self.extra_info = kwargs
 
-        self.soup: None | BeautifulSoup = None
         self.name: None | str = None
-        self.image: None | bytes = None
+        self.kind: None | str = None
+        self.population: None | int = None
+
+    @property
+    def extra_info(self) -> dict[str, str]:
+        return dict(zip(self._columns, self._values))
+
+    @extra_info.setter
+    def extra_info(self, extra_info: dict[str, str]) -> None:
+        self._columns = intern_columns(tuple(extra_info))
+        self._values = tuple(extra_info.values())
 
     @classmethod
     def from_dict(cls, loc_dict: dict) -> "Location":
@@ -34,145 +84,423 @@ class Location:
         return f'Location("{self.link}")'
 
     def __eq__(self, value: "Location") -> bool:
-        return self.link == value.link and self.__dict__ == value.__dict__
+        return (
+            self.link == value.link
+            and self.key == value.key
+            and self.name == value.name
+            and self.kind == value.kind
+            and self.population == value.population
+            and self.extra_info == value.extra_info
+        )
 
-    async def get_soup_properties(self, session: ClientSession) -> None:
-        if self.soup is None:
-            self.soup = await fetch_soup(self.link, session)
-        if self.name is None:
-            if isinstance(tag := self.soup.find("h1"), Tag):
-                self.name = str_from_tag(tag)
-            else:
-                raise Exception("Couldn't get tag from heading.")
-        if self.image is None:
-            self.image = await fetch_image(self.soup, session)
+    @property
+    def page(self) -> None | Page:
+        return self.cache.get(self.link, "page")
+
+    @property
+    def image(self) -> None | bytes:
+        return self.cache.get(self.link, "image")
+
+    async def get_page(
+        self, client: HttpClient | None = None, partial: bool = True
+    ) -> Page:
+        """
+        Return the extracted page from the cache, fetching it again if evicted. Replies
+        only need the main content, so by default only that is parsed.
+        """
+        if (page := self.page) is not None:
+            return page
+
+        page = await fetch_page(self.link, client, partial=partial)
+        self._put_page(page)
+
+        return page
+
+    def _put_page(self, page: Page) -> None:
+        self.cache.put(self.link, "page", page, page.size)
+        self.render_cache.invalidate(self.link)
+
+    def _put_extracted(self, task: asyncio.Task[Page]) -> None:
+        if task.cancelled():
+            return
+        if (e := task.exception()) is not None:
+            logger.warning(f"Could not extract {self.link}: {e!r}")
+            return
+        self._put_page(task.result())
+
+    async def get_image(
+        self, client: HttpClient | None = None, page: None | Page = None
+    ) -> bytes:
+        """
+        Return the page's infobox image from the cache, fetching it if needed. The page
+        is looked up with get_page unless given.
+        """
+        if (image := self.image) is not None:
+            return image
+
+        image = await fetch_image(page or await self.get_page(client), client)
+        self.cache.put(self.link, "image", image, len(image))
+
+        return image
+
+    async def get_reply_page(
+        self, with_image: bool, client: HttpClient | None = None
+    ) -> tuple[Page, None | bytes, None | asyncio.Future[Page]]:
+        """
+        Return what a reply needs before its first message: the page, its image if
+        with_image and it has one, and None. If the page isn't cached, only its lead is
+        returned, and then the page still being extracted, which is cached once done.
+        """
+        if (page := self.page) is not None:
+            rest = None
+        else:
+            page, rest = await fetch_page_lead(self.link, client)
+            rest.add_done_callback(self._put_extracted)
+        if not with_image or page.image_url is None:
+            return page, None, rest
+        return page, await self.get_image(client, page), rest
 
-    async def get_name(self, session: ClientSession) -> str:
-        if self.soup is None:
-            self.soup = await fetch_soup(self.link, session)
+    async def get_name(self, client: HttpClient | None = None) -> str:
         if self.name is None:
-            if isinstance(tag := self.soup.find("h1"), Tag):
-                self.name = str_from_tag(tag)
-            else:
-                raise Exception("Couldn't get tag from heading.")
+            self.name = (await self.get_page(client)).title
 
         return self.name
 
-    async def get_reply_chunks(
+    async def iter_reply_chunks(
         self,
+        page: Page,
         is_summary: bool,
         is_markdown: bool,
         continue_location: str = "",
-        session: ClientSession | None = None,
-    ) -> list:
-        if session is not None:
-            await self.get_soup_properties(session=session)
-        if self.soup is None:
-            raise Exception("Soup properties are undefined.")
-
-        logger.info(f"Started parsing soup: {self}.")
-        if is_markdown:
-            if self.image is None:
-                raise Exception("Soup properties are undefined.")
-            reply_chunks = await return_markdown_reply_chunks(
-                self, is_summary, continue_location
-            )
+        image: None | bytes = None,
+        rest: None | asyncio.Future[Page] = None,
+    ) -> AsyncIterator[str | bytes]:
+        """
+        Yield the title, the image (in markdown mode, if given) and then each text chunk
+        as soon as it is rendered, from what get_reply_page returned. When page is only
+        the lead, its chunks are yielded while rest is still being extracted.
+        """
+        key = (self.link, is_summary, is_markdown, page.revision)
+        if (chunks := self.render_cache.get(key)) is not None:
+            rendered = iter_chunks(chunks)
         else:
-            reply_chunks = await return_reply_chunks(
-                self, is_summary, continue_location
-            )
-        logger.info(f"Finished parsing soup: {self}.")
+            rendered = iter_stream_chunks(page, is_summary, is_markdown, rest)
+
+        new_chunks = []
+        async for chunk in rendered:
+            if chunks is None:
+                new_chunks.append(chunk)
+            yield chunk
+            if is_markdown and image is not None:
+                # Right after the title.
+                yield image
+                image = None
+        if chunks is None:
+            self.render_cache.put(key, new_chunks)
 
-        return reply_chunks
+        for chunk in continue_chunks(continue_location):
+            yield chunk
 
 
 class LocationsContainer:
+    """
+    Locations by key. Each location has an id, its position in a flat list, and each
+    key maps to the id of its location, or a tuple of ids if several share the key.
+    Populations and kind ranks are copied into arrays by id when locations are added,
+    for ranking and weighted sampling without touching the Location objects.
+    """
+
     def __init__(self, container_dict: dict | None = None) -> None:
+        self._locations: list[Location] = []
+        self._ids: dict[str, int | tuple[int, ...]] = {}
+        self._populations = array("q")
+        self._ranks = array("B")
+        self._matcher: None | LocationMatcher = None
+        self._titles: None | dict[str, list[Location]] = None
+        self._cum_weights: dict[str, list[float]] = {}
         if container_dict is not None:
-            self.container = container_dict
+            for key, location_list in container_dict.items():
+                for location in location_list:
+                    self._append(key, location)
+
+    def _key_ids(self, key: str) -> tuple[int, ...]:
+        ids = self._ids.get(key, ())
+        return (ids,) if isinstance(ids, int) else ids
+
+    def _append(self, key: str, location: Location) -> None:
+        location_id = len(self._locations)
+        self._locations.append(location)
+        self._populations.append(location.population or 0)
+        self._ranks.append(KIND_RANKS.get(location.kind or "", len(KIND_RANKS)))
+        if (ids := self._ids.get(key)) is None:
+            self._ids[key] = location_id
+            self._matcher = None
+        elif isinstance(ids, int):
+            self._ids[key] = (ids, location_id)
         else:
-            self.container: dict = dict()
-        self.next_id = 0
+            self._ids[key] = ids + (location_id,)
+        self._titles = None
+        self._cum_weights.clear()
+
+    def _replace(self, location_id: int, location: Location) -> None:
+        self._locations[location_id] = location
+        self._populations[location_id] = location.population or 0
+        self._ranks[location_id] = KIND_RANKS.get(location.kind or "", len(KIND_RANKS))
+        self._titles = None
+        self._cum_weights.clear()
+
+    def get_locations(self, key: str) -> list[Location]:
+        """Return the locations sharing a key, most likely meaning first."""
+        ids = sorted(
+            self._key_ids(key),
+            key=lambda location_id: (
+                self._ranks[location_id],
+                -self._populations[location_id],
+            ),
+        )
+        return [self._locations[location_id] for location_id in ids]
+
+    def items(self) -> Iterator[tuple[str, list[Location]]]:
+        """Yield each key with its locations, in the order they were added."""
+        for key in self._ids:
+            yield key, [
+                self._locations[location_id] for location_id in self._key_ids(key)
+            ]
 
     def __getitem__(self, item: str | Location) -> Location:
         if isinstance(item, str):
-            return self.container[item][0]
+            ids = self._ids[item]
+            return self._locations[ids if isinstance(ids, int) else ids[0]]
         else:
-            for location in self.container[item.key]:
-                if location.link == item.link:
-                    return location
+            for location_id in self._key_ids(item.key):
+                if self._locations[location_id].link == item.link:
+                    return self._locations[location_id]
             else:
                 raise KeyError
 
     def __setitem__(self, key: str | Location, value: Location) -> None:
         if isinstance(key, Location):
             key = key.key
-        for location in self.container.get(key, []):
+        for location_id in self._key_ids(key):
+            location = self._locations[location_id]
             if value.link == location.link:
                 if value != location:
                     logger.info(f"{location} modified")
-                self.container[key].remove(location)
-                self.container[key].append(value)
+                self._replace(location_id, value)
                 break
         else:
-            self.container[key] = self.container.get(key, []) + [value]
+            self._append(key, value)
 
-    def __iter__(self) -> Iterable:
-        return self.container.__iter__()
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
 
     def __len__(self) -> int:
-        return len(self.container)
+        return len(self._ids)
 
     def __add__(self, other: "LocationsContainer") -> "LocationsContainer":
-        locations1 = deepcopy(self)
-        locations2 = deepcopy(other)
-        for location_list in locations2.container.values():
-            for location in location_list:
-                try:
-                    current_location = locations1[location]
-                    if len(location.extra_info) > len(current_location.extra_info):
-                        locations1[location] = location
-                except KeyError:
-                    locations1[location] = location
-
-        return locations1
+        return LocationsContainer().merge_from(self, other)
+
+    def __iadd__(self, other: "LocationsContainer") -> "LocationsContainer":
+        return self.merge_from(other)
+
+    def merge_from(self, *others: "LocationsContainer") -> "LocationsContainer":
+        """
+        Merge the locations of others into this container in place and return it. A
+        location with the same key and link as an existing one replaces it only if it has
+        more extra_info. Location objects are shared, never copied.
+        """
+        for other in others:
+            for key, location_list in other.items():
+                current_ids = self._key_ids(key)
+                for location in location_list:
+                    for location_id in current_ids:
+                        current_location = self._locations[location_id]
+                        if current_location.link == location.link:
+                            if len(location.extra_info) > len(
+                                current_location.extra_info
+                            ):
+                                if location != current_location:
+                                    logger.info(f"{current_location} modified")
+                                self._replace(location_id, location)
+                            break
+                    else:
+                        self._append(key, location)
+
+        return self
 
     def __repr__(self) -> str:
         return f"LocationsContainer({len(self)} locations)"
 
+    @property
+    def matcher(self) -> LocationMatcher:
+        """The key matcher, built on first use and rebuilt after keys are added."""
+        if self._matcher is None:
+            self._matcher = LocationMatcher(self._ids)
+        return self._matcher
+
+    def build_matcher(self) -> None:
+        self._matcher = LocationMatcher(self._ids)
+
+    @property
+    def titles(self) -> dict[str, list[Location]]:
+        """Locations by lowercase page title, taken from the list tables' links."""
+        if self._titles is None:
+            self._titles = {}
+            for location in self._locations:
+                if location.name is not None:
+                    self._titles.setdefault(location.name.lower(), []).append(location)
+        return self._titles
+
+    @property
+    def locations(self) -> list[Location]:
+        """Every location in a flat list indexed by id."""
+        return self._locations
+
+    def cum_weights(self, weight: str) -> list[float]:
+        """
+        Cumulative weights of the flat locations list, by "population", or by "kind" so
+        that each kind of place is equally likely.
+        """
+        if (cum_weights := self._cum_weights.get(weight)) is None:
+            if weight == "population":
+                weights = self._populations
+            elif weight == "kind":
+                counts = Counter(self._ranks)
+                weights = [1 / counts[rank] for rank in self._ranks]
+            else:
+                raise ValueError(f"Unknown location weight: {weight}")
+            cum_weights = self._cum_weights[weight] = list(
+                itertools.accumulate(weights)
+            )
+        return cum_weights
+
+    def location_ids(self, other: "LocationsContainer") -> list[int]:
+        """Return the ids of the locations with the key and link of one in other."""
+        ids = []
+        for key, location_list in other.items():
+            links = {location.link for location in location_list}
+            ids += [
+                location_id
+                for location_id in self._key_ids(key)
+                if self._locations[location_id].link in links
+            ]
+        return sorted(ids)
+
+    def subset(self, ids: list[int]) -> "LocationsContainer":
+        """Return the locations with the given ids in a new container."""
+        locations = LocationsContainer()
+        for location_id in ids:
+            location = self._locations[location_id]
+            locations._append(location.key, location)
+        return locations
+
+    def save_snapshot(self, path: str, pages: dict | None = None) -> None:
+        """
+        Write the index to a gzipped JSON snapshot. Column names of extra_info are stored
+        once and referenced by position in each row. Rows are written in id order, so
+        that ids still refer to the same locations once loaded. pages is stored as is,
+        for IndexRefresher to pick up the list pages where it left them.
+        """
+        keys = [""] * len(self._locations)
+        for key in self._ids:
+            for location_id in self._key_ids(key):
+                keys[location_id] = key
+        columns: dict[str, int] = {}
+        rows = []
+        for key, location in zip(keys, self._locations):
+            extra_info = [
+                [columns.setdefault(column, len(columns)), value]
+                for column, value in location.extra_info.items()
+            ]
+            rows.append(
+                [
+                    key,
+                    location.link,
+                    location.name,
+                    location.kind,
+                    location.population,
+                    extra_info,
+                ]
+            )
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "created": time.time(),
+            "columns": list(columns),
+            "locations": rows,
+            "pages": pages or {},
+        }
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        logger.info(f"Saved snapshot of {self} to {path}.")
+
+    @classmethod
+    def load_snapshot(
+        cls, path: str, max_age: float | None = None
+    ) -> "LocationsContainer":
+        return cls.read_snapshot(path, max_age)[0]
+
+    @classmethod
+    def read_snapshot(
+        cls, path: str, max_age: float | None = None
+    ) -> tuple["LocationsContainer", dict]:
+        """
+        Read a snapshot written by save_snapshot, and return its locations and pages.
+        Raises ValueError if the snapshot has another version or is older than max_age
+        seconds.
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {path} has version {snapshot.get('version')}.")
+        if max_age is not None and time.time() - snapshot["created"] > max_age:
+            raise ValueError(f"Snapshot {path} is stale.")
+
+        columns = snapshot["columns"]
+        locations = cls()
+        for key, link, name, kind, population, extra_info in snapshot["locations"]:
+            location = Location(link, key)
+            location.name = name
+            location.kind = kind
+            location.population = population
+            location.extra_info = {
+                columns[column]: value for column, value in extra_info
+            }
+            locations._append(key, location)
+        logger.info(f"Loaded snapshot of {locations} from {path}.")
+
+        return locations, snapshot["pages"]
+
     @classmethod
     async def from_container(cls, container: dict) -> "LocationsContainer":
         return cls(container)
 
     async def get_possible_locations(
-        self, sentence: str, soup_properties: bool = True
+        self, sentence: str, longest_match: bool = False
     ) -> list[Location]:
-        """Returns a list of locations found in the sentence."""
-        possible_locations = []
-        sentence = f" {unidecode(sentence).lower()} "
-        for key in self.container.keys():
-            regex = r"\s[\W_]*" + re.escape(key) + r"[\W_]*\s"
-            if re.search(regex, sentence):
-                possible_locations += self.container.get(key, [])
+        """
+        Returns a list of locations found in the sentence, with the locations of each key
+        ranked by kind and population. Names come from the title index; pages are only
+        fetched for locations without one. With longest_match, only the longest of
+        overlapping location names is kept.
+        """
+        possible_locations = [
+            location
+            for key in self.matcher.find(unidecode(sentence).lower(), longest_match)
+            for location in self.get_locations(key)
+        ]
         if not possible_locations:
             return []
 
-        if soup_properties:
-            no_soup = [
-                location
-                for location in possible_locations
-                if any(value is None for value in location.__dict__.values())
-            ]
-            if no_soup:
-                async with ClientSession() as session:
-                    await asyncio.gather(
-                        *[
-                            location.get_soup_properties(session)
-                            for location in possible_locations
-                        ]
-                    )
-                for location in no_soup:
-                    logger.info(f"{location} modified")
+        # Fetching pages for names takes work pool workers, like replies.
+        if no_name := [loc for loc in possible_locations if loc.name is None]:
+            await asyncio.gather(
+                *[work_pool.run(location.get_name) for location in no_name]
+            )
 
         return possible_locations
 
@@ -180,29 +508,12 @@ class LocationsContainer:
         self, name: str, possible_locations: None | list[Location] = None
     ) -> Location:
         """Returns a location based on its "name" i.e. the wiki page's title."""
-        # We don't get the image to save time.
         if possible_locations is None:
-            possible_locations = await self.get_possible_locations(
-                name, soup_properties=False
-            )
+            if titled := self.titles.get(name.lower()):
+                return titled[0]
+            possible_locations = await self.get_possible_locations(name)
         if not possible_locations:
             raise KeyError("No name found")
-        no_soup = [
-            location
-            for location in possible_locations
-            if any(
-                value is None
-                for key, value in location.__dict__.items()
-                if key != "image"
-            )
-        ]
-        if no_soup:
-            async with ClientSession() as session:
-                await asyncio.gather(
-                    *[location.get_name(session) for location in possible_locations]
-                )
-            for location in no_soup:
-                logger.info(f"{location} modified")
 
         for location in possible_locations:
             if location.name is None:
@@ -212,23 +523,22 @@ class LocationsContainer:
         else:
             raise KeyError("No location found.")
 
-    async def random_location(self, soup_properties: bool = True) -> Location:
-        """Returns a random location in the LocationsContainer."""
-        location: Location = random.choice(
-            [location for key in self.container.values() for location in key]
-        )
-        if soup_properties:
-            if any(value is None for value in location.__dict__.values()):
-                async with ClientSession() as session:
-                    await location.get_soup_properties(session)
-                logger.info(f"{location} modified")
+    async def random_location(self, weight: None | str = None) -> Location:
+        """
+        Returns a random location in the LocationsContainer, uniformly or weighted by
+        "population" or "kind".
+        """
+        if weight is None:
+            location = random.choice(self.locations)
+        else:
+            location = random.choices(
+                self.locations, cum_weights=self.cum_weights(weight)
+            )[0]
+        if location.name is None:
+            await work_pool.run(location.get_name)
 
         return location
 
 
 def combine(*args: LocationsContainer):
-    combined = args[0]
-    for locations_container in args[1:]:
-        combined += locations_container
-
-    return combined
+    return LocationsContainer().merge_from(*args)
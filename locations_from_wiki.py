@@ -1,31 +1,61 @@
 import asyncio
 import logging
 import logging.config
+import os
 import re
 import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any
+from urllib.parse import unquote
 
-import aiohttp
-from bs4 import Tag
+from bs4 import BeautifulSoup, Tag
 from unidecode import unidecode
 
 from bs4_tools import str_from_tag
-from fetch_wiki import fetch_soup
-from locations_container import Location, LocationsContainer, combine
+from fetch_wiki import parse_soup
+from http_client import HttpClient, get_client
+from locations_container import (
+    Location,
+    LocationsContainer,
+    combine,
+    parse_population,
+)
+from parse_pool import ParsePool, get_pool
 
 logger = logging.getLogger(__name__)
 
+CITIES_LINK = "https://en.wikipedia.org/wiki/List_of_towns_and_cities_with_100,000_or_more_inhabitants"
+COUNTRIES_LINK = (
+    "https://en.wikipedia.org/wiki/List_of_countries_by_population_(United_Nations)"
+)
+COUNTRY_COLUMNS = ["Location", "Population (1 July 2023)", "UN Continental Region"]
+CONTINENTS_LINK = "https://en.wikipedia.org/wiki/List_of_continents_and_continental_subregions_by_population"
+CONTINENT_COLUMNS = ["Continent", "Population (2021)", "Countries (2021)"]
 
-async def parse_rows(
+
+def title_from_anchor(anchor: Tag) -> str:
+    """Return the title of the Wiki page an anchor links to, without fetching it."""
+    if isinstance(title := anchor.get("title"), str) and title:
+        return title
+    return unquote(anchor["href"].split("/wiki/")[-1].split("#")[0]).replace("_", " ")
+
+
+def parse_rows(
     rows,
     headers,
     column_select=None,
     data_tag=("td",),
     extra_columns=None,
     skip_same=False,
+    kind=None,
 ):
     """
     Returns a LocationsContainer objet after parsing a list of row Tag objects and a
-    list of header strings.
+    list of header strings. Locations get the given kind and the population parsed
+    from their row.
     """
     locations = LocationsContainer()
     if column_select:
@@ -43,7 +73,7 @@ async def parse_rows(
         key = unidecode(
             row_data[0].lower()
         )  # The key is the ascii transliteration of the location name
-        if skip_same and key in locations.container.keys():
+        if skip_same and key in locations:
             continue
 
         row_dict = dict(zip(headers, row_data))
@@ -57,6 +87,9 @@ async def parse_rows(
             row_dict = {**row_dict, **extra_columns}
 
         location = Location.from_dict(row_dict)
+        location.name = title_from_anchor(anchor)
+        location.kind = kind
+        location.population = parse_population(location.extra_info)
         if key == "santa cruz":
             pass
         try:
@@ -69,118 +102,411 @@ async def parse_rows(
     return locations
 
 
-async def from_city_homepage(link, column_select=None):
-    async with aiohttp.ClientSession() as session:
-        soup = await fetch_soup(link, session)
-        logger.info(f"Started parsing soup: {link}")
-        anchors = soup.find_all(
-            "a",
-            title=re.compile(
-                r"List of towns and cities with 100,000 or more inhabitants/country.*"
-            ),
-        )
-        links = ["https://en.wikipedia.org" + anchor["href"] for anchor in anchors]
-        locations = await asyncio.gather(
-            *[
-                from_city_wiki_tables(link, column_select=column_select)
-                for link in links
-            ]
-        )
-
-        logger.info(f"Finished parsing soup: {link}")
-
-        return combine(*locations)
+def country_page_links(soup: BeautifulSoup) -> list[str]:
+    """Return the links to the list of cities pages of each country."""
+    anchors = soup.find_all(
+        "a",
+        title=re.compile(
+            r"List of towns and cities with 100,000 or more inhabitants/country.*"
+        ),
+    )
+    return ["https://en.wikipedia.org" + anchor["href"] for anchor in anchors]
 
 
-async def from_city_wiki_tables(link, column_select=None):
+def parse_city_tables(soup, column_select=None):
     """
-    Return a cities + states/districts dictionary given a Wiki page with links to list
-    of cities Wiki pages.
+    Return a cities + states/districts dictionary given the soup of a list of cities
+    Wiki page.
     """
     locations = LocationsContainer()
-    async with aiohttp.ClientSession() as session:
-        soup = await fetch_soup(link, session)
-        logger.info(f"Started parsing soup: {link}")
-        for table in soup.find_all("table", class_="wikitable"):
-            rows = table.find_all("tr")
-            headers = [
-                str_from_tag(header, separator=" ") for header in table.find_all("th")
-            ]
-            country = str_from_tag(table.find_previous("h2"))
-            cities = await parse_rows(
-                rows[1:],
-                headers,
-                column_select=column_select,
-                extra_columns={"Country": country},
+    for table in soup.find_all("table", class_="wikitable"):
+        rows = table.find_all("tr")
+        headers = [
+            str_from_tag(header, separator=" ") for header in table.find_all("th")
+        ]
+        country = str_from_tag(table.find_previous("h2"))
+        cities = parse_rows(
+            rows[1:],
+            headers,
+            column_select=column_select,
+            extra_columns={"Country": country},
+            kind="city",
+        )
+        if (
+            len(headers) > 2
+        ):  # Some tables contain only 2 columns without a state/district
+            states = parse_rows(
+                rows[1:], headers, column_select=[1], skip_same=True, kind="state"
             )
-            if (
-                len(headers) > 2
-            ):  # Some tables contain only 2 columns without a state/district
-                states = await parse_rows(
-                    rows[1:], headers, column_select=[1], skip_same=True
-                )
-            else:
-                states = LocationsContainer()
-            locations += cities + states
-        logger.info(f"Finished parsing soup: {link}")
+        else:
+            states = LocationsContainer()
+        locations += cities + states
 
     return locations
 
 
-async def from_country_wiki_tables(link, column_select=None):
+def parse_country_table(soup, column_select=None):
     """
-    Return a countries dictionary given a link to a list of countries Wiki page.
+    Return a countries dictionary given the soup of a list of countries Wiki page.
     """
-    async with aiohttp.ClientSession() as session:
-        soup = await fetch_soup(link, session)
-        logger.info(f"Started parsing soup: {link}")
-        table = soup.table
-        if not isinstance(table, Tag):
-            raise NotImplementedError(f"Expected {table} to be Tag object.")
-        rows = table.find_all("tr")
-        headers = [str_from_tag(header) for header in table.find_all("th")]
-        locations = await parse_rows(rows[2:], headers, column_select=column_select)
-        logger.info(f"Finished parsing soup: {link}")
+    table = soup.table
+    if not isinstance(table, Tag):
+        raise NotImplementedError(f"Expected {table} to be Tag object.")
+    rows = table.find_all("tr")
+    headers = [str_from_tag(header) for header in table.find_all("th")]
+    return parse_rows(rows[2:], headers, column_select=column_select, kind="country")
+
+
+def parse_continent_table(soup, column_select=None):
+    """
+    Return a continents dictionary given the soup of a list of continents Wiki page.
+    """
+    table = soup.table
+    if not isinstance(table, Tag):
+        raise NotImplementedError(f"Expected {table} to be Tag object.")
+    rows = table.find_all("tr")
+    headers = [str_from_tag(header) for header in rows[0].find_all(["th", "td"])]
+    return parse_rows(
+        rows[2:],
+        headers,
+        column_select=column_select,
+        data_tag=["th", "td"],
+        kind="continent",
+    )
+
+
+@dataclass
+class ListPage:
+    """A list page the index is built from, with what was parsed from it last time."""
+
+    link: str
+    parse: Callable[[BeautifulSoup], Any]
+    validators: dict[str, str] = field(default_factory=dict)
+    result: Any = None
+
+
+@dataclass
+class PageReport:
+    """How fetching and parsing one list page went during a build."""
+
+    link: str
+    status: str = "pending"  # Then "changed", "unchanged" or "failed"
+    seconds: float = 0
+    bytes: int = 0
+    attempts: int = 0
+    error: str = ""
+
+
+@dataclass
+class BuildReport:
+    """Per-page timings, sizes and failures of an index build."""
+
+    seconds: float = 0
+    pages: list[PageReport] = field(default_factory=list)
+
+    @property
+    def failures(self) -> list[PageReport]:
+        return [page for page in self.pages if page.status == "failed"]
+
+    def slowest(self, count: int = 5) -> list[PageReport]:
+        return sorted(self.pages, key=lambda page: page.seconds, reverse=True)[:count]
+
+    def summary(self) -> str:
+        statuses = Counter(page.status for page in self.pages)
+        lines = [
+            f"{len(self.pages)} list pages in {self.seconds:.1f}s: "
+            f"{statuses['changed']} changed, {statuses['unchanged']} unchanged, "
+            f"{statuses['failed']} failed, "
+            f"{sum(page.bytes for page in self.pages) / 2**20:.1f} MiB downloaded",
+            "Slowest: "
+            + ", ".join(
+                f"{page_title(page.link)} {page.seconds:.1f}s"
+                for page in self.slowest()
+            ),
+        ]
+        lines += [
+            f"Failed: {page_title(page.link)} after {page.attempts} attempts: "
+            f"{page.error}"
+            for page in self.failures
+        ]
+        return "\n".join(lines)
 
-    return locations
 
+def page_title(link: str) -> str:
+    return unquote(link.split("/wiki/")[-1]).replace("_", " ")
 
-async def from_continent_wiki_tables(link, column_select=None):
+
+def parse_list_page(parse: Callable[[BeautifulSoup], Any], html: str) -> Any:
+    """Parse a list page's HTML with parse. This runs in a worker process."""
+    return parse(parse_soup(html))
+
+
+class IndexRefresher:
     """
-    Return a continents dictionary given a link to a list of continents Wiki page.
+    Builds the index from the list pages, keeping each page's ETag/Last-Modified
+    validators and parsed locations. Later builds use conditional requests, so
+    unchanged pages cost a 304 response, and only changed pages are parsed again.
+
+    At most concurrency pages are fetched and parsed at a time. A page that still
+    fails after retries keeps what was parsed from it by the previous build, or is left
+    out of the index, instead of failing the whole build. Once there is an index, a
+    build missing a page that was never parsed returns None, so the index is kept.
+
+    The validators and parsed locations are saved with the snapshot (snapshot_pages),
+    and picked up from it after a restart (seed).
     """
-    async with aiohttp.ClientSession() as session:
-        soup = await fetch_soup(link, session)
-        logger.info(f"Started parsing soup: {link}")
-        table = soup.table
-        if not isinstance(table, Tag):
-            raise NotImplementedError(f"Expected {table} to be Tag object.")
-        rows = table.find_all("tr")
-        headers = [str_from_tag(header) for header in rows[0].find_all(["th", "td"])]
-        locations = await parse_rows(
-            rows[2:], headers, column_select=column_select, data_tag=["th", "td"]
+
+    def __init__(
+        self,
+        client: HttpClient | None = None,
+        pool: ParsePool | None = None,
+        concurrency: int = 8,
+        retries: int = 2,
+        retry_delay: float = 1,
+        timeout: float = 30,
+    ) -> None:
+        self.client = client
+        self.pool = pool
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.home = ListPage(CITIES_LINK, country_page_links)
+        self.city_pages: dict[str, ListPage] = {}
+        self.other_pages = [
+            ListPage(
+                COUNTRIES_LINK,
+                partial(parse_country_table, column_select=COUNTRY_COLUMNS),
+            ),
+            ListPage(
+                CONTINENTS_LINK,
+                partial(parse_continent_table, column_select=CONTINENT_COLUMNS),
+            ),
+        ]
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.builds = 0
+        self.pages_changed = 0
+        self.pages_unchanged = 0
+        self.pages_failed = 0
+        self.last_build: None | float = None
+        self.last_report: None | BuildReport = None
+        self.has_index = False
+
+    async def _fetch(self, page: ListPage, report: PageReport) -> bool:
+        """Fetch and parse page if it changed, and return whether it did."""
+        client = self.client or get_client()
+        # The refresher does its own retries, so that a hanging page holds its slot
+        # for at most (retries + 1) * timeout seconds.
+        html, validators = await client.get_text_if_modified(
+            page.link, page.validators, retries=0, timeout=self.timeout
+        )
+        if html is None:
+            # Validators are only kept once the page has been parsed.
+            return False
+        report.bytes = len(html.encode())
+        # Parse in the parse pool so that message handling goes on during a refresh.
+        page.result = await (self.pool or get_pool()).run(
+            parse_list_page, page.parse, html
         )
-        logger.info(f"Finished parsing soup: {link}")
+        page.validators = validators
+        return True
+
+    async def _update(self, page: ListPage, report: BuildReport) -> bool:
+        page_report = PageReport(page.link)
+        report.pages.append(page_report)
+        async with self._semaphore:
+            start = time.perf_counter()
+            for attempt in range(self.retries + 1):
+                page_report.attempts = attempt + 1
+                try:
+                    changed = await self._fetch(page, page_report)
+                    break
+                except Exception as e:
+                    page_report.error = f"{type(e).__name__}: {e}"
+                    if attempt == self.retries:
+                        changed = False
+                        page_report.status = "failed"
+                        self.pages_failed += 1
+                        logger.warning(
+                            f"Could not update {page.link}, "
+                            f"{'keeping the previous' if page.result is not None else 'skipping its'} "
+                            f"locations: {page_report.error}"
+                        )
+                    else:
+                        await asyncio.sleep(self.retry_delay * 2**attempt)
+            page_report.seconds = time.perf_counter() - start
+
+        if page_report.status != "failed":
+            page_report.status = "changed" if changed else "unchanged"
+            if changed:
+                self.pages_changed += 1
+            else:
+                self.pages_unchanged += 1
+        done = sum(page.status != "pending" for page in report.pages)
+        logger.info(
+            f"[{done}/{len(report.pages)}] {page_title(page.link)}: "
+            f"{page_report.status} in {page_report.seconds:.1f}s "
+            f"({page_report.bytes} bytes)"
+        )
+        return changed
+
+    async def build(self) -> None | LocationsContainer:
+        """
+        Return the index rebuilt from the list pages, or None if none of them changed
+        since the last build, or if there is an index already and a page missing from
+        this one failed. Raises if the cities home page has never been parsed, as the
+        index would then have no cities at all.
+        """
+        async with self._lock:
+            start = time.perf_counter()
+            report = BuildReport()
+            async with asyncio.TaskGroup() as tg:
+                others = [
+                    tg.create_task(self._update(page, report))
+                    for page in self.other_pages
+                ]
+                pages_moved = False
+                if await self._update(self.home, report):
+                    links = self.home.result
+                    pages_moved = links != list(self.city_pages)
+                    self.city_pages = {
+                        link: self.city_pages.get(link)
+                        or ListPage(link, parse_city_tables)
+                        for link in links
+                    }
+                cities = [
+                    tg.create_task(self._update(page, report))
+                    for page in self.city_pages.values()
+                ]
+            changed = [task.result() for task in [*cities, *others]]
+            report.seconds = time.perf_counter() - start
+            self.builds += 1
+            self.last_build = time.time()
+            self.last_report = report
+            logger.info(f"Index build report:\n{report.summary()}")
+
+            if self.home.result is None:
+                raise ValueError("The cities home page could not be fetched.")
+            pages = [*self.city_pages.values(), *self.other_pages]
+            parsed = [page.result for page in pages if page.result is not None]
+            if not pages_moved and not any(changed):
+                logger.info("List pages unchanged since the last build.")
+                return None
+            missing = [page.link for page in pages if page.result is None]
+            if missing and self.has_index:
+                logger.warning(
+                    f"Keeping the current index, {len(missing)} list pages were "
+                    f"never parsed: {', '.join(map(page_title, missing))}"
+                )
+                return None
 
+            locations = combine(*parsed)
+            await asyncio.to_thread(locations.build_matcher)
+            logger.info(
+                f"Built {locations} in {time.perf_counter() - start:.1f}s, "
+                f"{sum(changed)} of {len(pages)} list pages changed."
+            )
+            self.has_index = True
+            return locations
+
+    def snapshot_pages(self, locations: LocationsContainer) -> dict:
+        """
+        Return the validators and results of the parsed list pages, for the snapshot of
+        locations, the index last built from them. Locations are stored as their ids.
+        """
+        pages = {}
+        if self.home.result is not None:
+            pages[self.home.link] = {
+                "validators": self.home.validators,
+                "result": self.home.result,
+            }
+        for page in [*self.city_pages.values(), *self.other_pages]:
+            if page.result is not None:
+                pages[page.link] = {
+                    "validators": page.validators,
+                    "result": locations.location_ids(page.result),
+                }
+        return pages
+
+    def seed(self, locations: LocationsContainer, pages: dict) -> None:
+        """
+        Pick up the list pages from a snapshot of locations, with the pages
+        snapshot_pages returned for it. Pages missing from it, like all of them for a
+        snapshot built from a dump, are fetched in full by the next build.
+        """
+        self.has_index = True
+        if (home := pages.get(self.home.link)) is None:
+            return
+        self.home.validators = home["validators"]
+        self.home.result = home["result"]
+        self.city_pages = {
+            link: ListPage(link, parse_city_tables) for link in self.home.result
+        }
+        for page in [*self.city_pages.values(), *self.other_pages]:
+            if (saved := pages.get(page.link)) is not None:
+                page.validators = saved["validators"]
+                page.result = locations.subset(saved["result"])
+
+    @property
+    def last_build_complete(self) -> bool:
+        """Whether the last build got every list page, so its index can be saved."""
+        return self.last_report is not None and not self.last_report.failures
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "builds": self.builds,
+            "list_pages": 1 + len(self.city_pages) + len(self.other_pages),
+            "pages_changed": self.pages_changed,
+            "pages_unchanged": self.pages_unchanged,
+            "pages_failed": self.pages_failed,
+            "last_build": round(self.last_build or 0),
+            "last_build_seconds": round(
+                self.last_report.seconds if self.last_report else 0, 1
+            ),
+        }
+
+
+async def create_locations(refresher: IndexRefresher | None = None):
+    locations = await (refresher or IndexRefresher()).build()
+    if locations is None:
+        raise ValueError("The refresher has already built the locations.")
     return locations
 
 
-async def create_locations():
-    start = time.time()
-    cities_coro = from_city_homepage(
-        "https://en.wikipedia.org/wiki/List_of_towns_and_cities_with_100,000_or_more_inhabitants",
-    )
-    countries_coro = from_country_wiki_tables(
-        "https://en.wikipedia.org/wiki/List_of_countries_by_population_(United_Nations)",
-        column_select=["Location", "Population (1 July 2023)", "UN Continental Region"],
-    )
-    continent_coro = from_continent_wiki_tables(
-        "https://en.wikipedia.org/wiki/List_of_continents_and_continental_subregions_by_population",
-        column_select=["Continent", "Population (2021)", "Countries (2021)"],
-    )
-    locations = await asyncio.gather(cities_coro, countries_coro, continent_coro)
-    locations = combine(*locations)
-    logger.info(f"TIME: {time.time() - start}")
+async def load_locations(
+    snapshot_path: str,
+    max_age: float | None = None,
+    rebuild: bool = False,
+    refresher: IndexRefresher | None = None,
+) -> LocationsContainer:
+    """
+    Return the locations from the snapshot at snapshot_path, rebuilding them from
+    Wikipedia (and rewriting the snapshot) if asked to, or if the snapshot is missing,
+    unreadable or older than max_age seconds. Rebuilding goes through refresher, which
+    keeps the list pages for later refreshes, and is seeded with those saved with the
+    snapshot otherwise. An index missing list pages that failed
+    is used but not saved, so the next start builds it again.
+    """
+    if not rebuild and os.path.exists(snapshot_path):
+        try:
+            locations, pages = await asyncio.to_thread(
+                LocationsContainer.read_snapshot, snapshot_path, max_age
+            )
+            await asyncio.to_thread(locations.build_matcher)
+            if refresher is not None:
+                refresher.seed(locations, pages)
+            return locations
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Rebuilding locations, could not load snapshot: {e}")
+
+    refresher = refresher or IndexRefresher()
+    locations = await create_locations(refresher)
+    if refresher.last_build_complete:
+        await asyncio.to_thread(
+            locations.save_snapshot, snapshot_path, refresher.snapshot_pages(locations)
+        )
+    else:
+        logger.warning("Not saving the snapshot, some list pages failed.")
     return locations
 
 
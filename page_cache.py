@@ -0,0 +1,149 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """
+    Least recently used cache of per-page payloads (parsed soups, images), bounded by
+    an approximate memory budget in bytes.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], tuple[Any, int]] = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, item: tuple[str, str]) -> bool:
+        return item in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, link: str, kind: str) -> Any:
+        """Return the cached payload or None, marking it as recently used."""
+        entry = self._entries.get((link, kind))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((link, kind))
+        self.hits += 1
+
+        return entry[0]
+
+    def put(self, link: str, kind: str, value: Any, size: int) -> None:
+        """Store a payload of approximately size bytes and evict the coldest entries."""
+        self.discard(link, kind)
+        if size > self.max_bytes:
+            logger.info(f"Not caching {kind} of {link}: {size} bytes exceeds budget.")
+            return
+        self._entries[(link, kind)] = (value, size)
+        self.resident_bytes += size
+        while self.resident_bytes > self.max_bytes:
+            (evicted_link, evicted_kind), (_, evicted_size) = self._entries.popitem(
+                last=False
+            )
+            self.resident_bytes -= evicted_size
+            self.evictions += 1
+            logger.debug(f"Evicted {evicted_kind} of {evicted_link}.")
+
+    def discard(self, link: str, kind: str | None = None) -> None:
+        """Remove one payload of a page, or all of them if kind is None."""
+        kinds = (
+            [kind] if kind is not None else [k for l, k in self._entries if l == link]
+        )
+        for k in kinds:
+            if (entry := self._entries.pop((link, k), None)) is not None:
+                self.resident_bytes -= entry[1]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class RenderCache:
+    """
+    Cache of rendered reply chunks keyed by (link, is_summary, is_markdown, revision),
+    with entries expiring after ttl seconds and the least recently used ones evicted
+    beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[list[str], int, float]] = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> list[str] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry[2] > self.ttl:
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return entry[0]
+
+    def put(self, key: tuple, chunks: list[str]) -> None:
+        self._pop(key)
+        size = sum(len(chunk) for chunk in chunks)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (chunks, size, time.monotonic())
+        self.resident_bytes += size
+        while self.resident_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._pop(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, link: str) -> None:
+        """Drop every rendering of a page, e.g. after it has been fetched again."""
+        for key in [key for key in self._entries if key[0] == link]:
+            self._pop(key)
+
+    def _pop(self, key: tuple) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self.resident_bytes -= entry[1]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+page_cache = PageCache(int(os.environ.get("PAGE_CACHE_BYTES", 64 * 1024 * 1024)))
+render_cache = RenderCache(
+    int(os.environ.get("RENDER_CACHE_BYTES", 16 * 1024 * 1024)),
+    float(os.environ.get("RENDER_CACHE_TTL", 10 * 60)),
+)
@@ -0,0 +1,225 @@
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+from bs4_tools import markdown_from_tag, str_from_tag
+
+URL_DOMAIN = "https://en.wikipedia.org"
+BLOCK_TAGS = {"p", "h2", "h3", "ul", "ol"}
+END_PHRASES = ["see also", "notes", "references", "external links"]
+HEADING = re.compile(r"<h([23])\b.*?</h\1>", re.DOTALL)
+MARKUP = re.compile(r"<[^>]*>")
+
+
+@dataclass
+class Block:
+    """A paragraph, heading or list of an article in both renderings."""
+
+    kind: str
+    text: str
+    markdown: str
+
+
+@dataclass
+class Page:
+    """
+    Everything replies need from a Wiki article, extracted once after fetching. The
+    first summary_end blocks come before the first heading.
+    """
+
+    link: str
+    title: str
+    title_markdown: str
+    image_url: str | None
+    revision: int = 0
+    blocks: list[Block] = field(default_factory=list)
+    summary_end: int = 0
+
+    @property
+    def size(self) -> int:
+        return (
+            len(self.title)
+            + len(self.title_markdown)
+            + sum(len(block.text) + len(block.markdown) for block in self.blocks)
+        )
+
+    def get_title(self, is_markdown: bool) -> str:
+        return self.title_markdown if is_markdown else self.title
+
+    def iter_lines(self, is_summary: bool, is_markdown: bool) -> Iterator[str]:
+        """
+        Yield the lines of the summary or content as soon as later blocks can no longer
+        change them, so that replies can be sent while the rest is being rendered.
+        """
+        renderer = LineRenderer(is_summary, is_markdown)
+        for block in self.blocks[: self.summary_end] if is_summary else self.blocks:
+            yield from renderer.add(block)
+            if renderer.ended:
+                break
+        yield from renderer.finish()
+
+    def get_summary(self, is_markdown: bool) -> str:
+        return "\n".join(self.iter_lines(True, is_markdown))
+
+    def get_content(self, is_markdown: bool) -> str:
+        return "\n".join(self.iter_lines(False, is_markdown))
+
+
+class LineRenderer:
+    """
+    Turns the blocks of a summary or content into reply lines, one block at a time, so
+    that blocks can be rendered as soon as they are extracted.
+    """
+
+    def __init__(self, is_summary: bool, is_markdown: bool) -> None:
+        self.is_summary = is_summary
+        self.is_markdown = is_markdown
+        self.text = ""
+        self.ended = False
+
+    def add(self, block: Block) -> list[str]:
+        """Add a block and return the lines later blocks can no longer change."""
+        block_text = block.markdown if self.is_markdown else block.text
+        if self.ended or not block_text:
+            return []
+        if self.is_summary:
+            if block.kind != "p":
+                return []
+            self.text += f"{block_text}\n\n"
+        elif any(phrase in block_text.lower() for phrase in END_PHRASES):
+            # Parse only main content
+            self.ended = True
+            return []
+        elif block.kind == "p":
+            self.text += f"{block_text}\n\n"
+        elif block.kind in ["ul", "ol"]:
+            self.text = f"{self.text.rstrip()}\n{block_text}\n\n"
+        else:
+            self.text += f"{block_text}\n"
+
+        # Only trailing whitespace is ever removed, so complete lines before the last
+        # non-whitespace character are final.
+        final_end = self.text.rfind("\n", 0, len(self.text.rstrip()))
+        if final_end == -1:
+            return []
+        lines = self.text[:final_end].split("\n")
+        self.text = self.text[final_end + 1 :]
+        return lines
+
+    def finish(self) -> list[str]:
+        """Return the remaining lines once every block has been added."""
+        return self.text.rstrip().split("\n")
+
+
+def iter_blocks(tag: Tag):
+    """Yield the block tags under tag in document order, skipping tables."""
+    for child in tag.children:
+        if not isinstance(child, Tag) or child.name == "table":
+            continue
+        if child.name in BLOCK_TAGS:
+            yield child
+        yield from iter_blocks(child)
+
+
+def get_image_url(soup: BeautifulSoup) -> str | None:
+    infobox = soup.find("table", class_="infobox")
+    if not isinstance(infobox, Tag):
+        return None
+    img_tag = infobox.find("img")
+    if not isinstance(img_tag, Tag) or not isinstance(src := img_tag.get("src"), str):
+        return None
+
+    return "https:" + src
+
+
+def get_revision(html: str) -> int:
+    if match := re.search(r'"wgRevisionId":(\d+)', html):
+        return int(match.group(1))
+    return 0
+
+
+def main_content_html(html: str, lead: bool = False) -> str:
+    """
+    Return the h1 title of an article's HTML followed by its main content up to the
+    first heading with an end phrase, e.g. "See also". Replies stop at that heading, so
+    the menus, reference lists, navigation boxes and footer around it aren't needed.
+    With lead, the content stops at the first heading outside tables instead, after
+    the lead section summaries show.
+    """
+    title = html.find("<h1")
+    title_end = html.find("</h1>", title)
+    marker = html.find('id="mw-content-text"')
+    if -1 in (title, title_end, marker) or marker < title_end:
+        return html
+    title_end += len("</h1>")
+    content = html.rfind("<", 0, marker)
+    for heading in HEADING.finditer(html, content):
+        if lead:
+            # Blocks in tables are skipped, so their headings don't end the lead.
+            end = heading.start()
+            if html.count("<table", content, end) == html.count(
+                "</table>", content, end
+            ):
+                return html[title:title_end] + html[content:end]
+            continue
+        text = MARKUP.sub("", heading[0]).lower()
+        if any(phrase in text for phrase in END_PHRASES):
+            return html[title:title_end] + html[content : heading.start()]
+    return html[title:title_end] + html[content:]
+
+
+def is_main_region(name: str, attrs: dict[str, str]) -> bool:
+    return name == "h1" or attrs.get("id") == "mw-content-text"
+
+
+def extract_page(
+    html: str, link: str, partial: bool = False, lead: bool = False
+) -> Page:
+    """
+    Parse an article's HTML into a Page. This runs in a worker process, so only the
+    returned Page crosses back to the event loop.
+
+    With partial, only the title and the main content up to the first end phrase
+    heading are parsed, skipping the head, sidebars, reference lists and footer. The
+    Page then lacks the blocks after that heading, which replies never show.
+
+    With lead, only the title and the lead section are parsed: the Page has the same
+    title, image and summary, but its blocks stop at the first heading, so parsing it
+    takes no longer for longer articles.
+    """
+    if partial or lead:
+        soup = BeautifulSoup(
+            main_content_html(html, lead),
+            "html.parser",
+            parse_only=SoupStrainer(is_main_region),
+        )
+    else:
+        soup = BeautifulSoup(html, "html.parser")
+    heading = soup.find("h1")
+    content = soup.find("div", id="mw-content-text")
+    if not isinstance(heading, Tag) or not isinstance(content, Tag):
+        raise Exception("Expected Tag object.")
+
+    page = Page(
+        link=link,
+        title=str_from_tag(heading),
+        title_markdown=markdown_from_tag(heading, link, URL_DOMAIN),
+        image_url=get_image_url(soup),
+        revision=get_revision(html),
+    )
+    summary_end = None
+    for tag in iter_blocks(content):
+        if summary_end is None and tag.name in ["h2", "h3"]:
+            summary_end = len(page.blocks)
+        page.blocks.append(
+            Block(
+                tag.name,
+                str_from_tag(tag),
+                markdown_from_tag(tag, link, URL_DOMAIN),
+            )
+        )
+    page.summary_end = len(page.blocks) if summary_end is None else summary_end
+
+    return page
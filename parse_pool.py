@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class ParsePool:
+    """
+    Runs CPU-bound HTML parsing in worker processes so the event loop stays responsive.
+    With workers=0, or if the pool breaks, functions run in the event loop instead.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor | None:
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        if (executor := self.executor) is None:
+            return func(*args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, func, *args
+            )
+        except BrokenProcessPool:
+            logger.warning("Parse pool broke, falling back to in-loop parsing.")
+            self.close()
+            self.workers = 0
+            return func(*args)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_pool: ParsePool | None = None
+
+
+def get_pool() -> ParsePool:
+    """Return the shared pool, sized by the PARSE_WORKERS environment variable."""
+    global _pool
+    if _pool is None:
+        _pool = ParsePool(int(os.environ.get("PARSE_WORKERS", 2)))
+    return _pool
+
+
+def set_pool(pool: ParsePool) -> None:
+    global _pool
+    _pool = pool
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class Sendable(Protocol):
+    id: int
+
+    async def send(self, *args, **kwargs) -> Any: ...
+
+
+class RateWindow:
+    """Allows at most limit sends in any period seconds."""
+
+    def __init__(self, limit: int, period: float) -> None:
+        self.limit = limit
+        self.period = period
+        self.sends: deque[float] = deque()
+
+    def delay(self, now: float) -> float:
+        """Return how long until a send is allowed."""
+        while self.sends and now - self.sends[0] >= self.period:
+            self.sends.popleft()
+        if len(self.sends) < self.limit:
+            return 0
+        return self.sends[0] + self.period - now
+
+    def take(self, now: float) -> None:
+        self.sends.append(now)
+
+
+class SendScheduler:
+    """
+    Sends messages as fast as per-channel and global rate limit budgets allow. Channels
+    with pending messages are served round robin so that one long reply can't starve
+    the others, and each channel has at most one send in flight to keep its order.
+    """
+
+    def __init__(
+        self,
+        channel_limit: int = 5,
+        channel_period: float = 5,
+        global_limit: int = 50,
+        global_period: float = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.channel_limit = channel_limit
+        self.channel_period = channel_period
+        self.clock = clock
+        self._global = RateWindow(global_limit, global_period)
+        self._windows: dict[int, RateWindow] = {}
+        self._queues: dict[
+            int, deque[tuple[asyncio.Future, float, Sendable, tuple, dict]]
+        ] = {}
+        self._order: deque[int] = deque()
+        self._busy: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+        self.sent = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def send(self, channel: Sendable, *args, **kwargs) -> Any:
+        """Queue channel.send(*args, **kwargs) and return its result once sent."""
+        future = asyncio.get_running_loop().create_future()
+        if channel.id not in self._queues:
+            self._queues[channel.id] = deque()
+            self._order.append(channel.id)
+        self._queues[channel.id].append((future, self.clock(), channel, args, kwargs))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+        # Cancelling the caller cancels the future, which the dispatcher then skips.
+        return await future
+
+    def queue_depth(self) -> int:
+        return sum(
+            not future.cancelled()
+            for queue in self._queues.values()
+            for future, *_ in queue
+        )
+
+    def _next_channel(self, now: float) -> tuple[int | None, float]:
+        """
+        Return the next ready channel in round robin order, or how long to wait. Only
+        the returned channel goes to the back, so channels skipped while their previous
+        send is in flight or their budget is spent keep their turn.
+        """
+        wait = float("inf")
+        for channel_id in list(self._order):
+            queue = self._queues[channel_id]
+            while queue and queue[0][0].cancelled():
+                queue.popleft()
+            if not queue:
+                del self._queues[channel_id]
+                self._order.remove(channel_id)
+                continue
+            if channel_id in self._busy:
+                continue
+            window = self._windows.setdefault(
+                channel_id, RateWindow(self.channel_limit, self.channel_period)
+            )
+            if (delay := window.delay(now)) == 0:
+                self._order.remove(channel_id)
+                self._order.append(channel_id)
+                return channel_id, 0
+            wait = min(wait, delay)
+
+        return None, wait
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = self.clock()
+            # A channel is only picked once the global budget allows a send, so that
+            # waiting for it doesn't cost the channel its turn.
+            if (wait := self._global.delay(now)) == 0:
+                channel_id, wait = self._next_channel(now)
+                if channel_id is not None:
+                    self._start_send(channel_id, now)
+                    continue
+            if not self._queues and not self._busy:
+                # Forget channels once their past sends no longer count.
+                for channel_id, window in list(self._windows.items()):
+                    window.delay(now)
+                    if not window.sends:
+                        del self._windows[channel_id]
+                if not self._windows:
+                    return
+                wait = min(
+                    window.sends[0] + window.period - now
+                    for window in self._windows.values()
+                )
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), None if wait == float("inf") else wait
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_send(self, channel_id: int, now: float) -> None:
+        future, queued_at, channel, args, kwargs = self._queues[channel_id].popleft()
+        self._windows[channel_id].take(now)
+        self._global.take(now)
+        self._busy.add(channel_id)
+        waited = now - queued_at
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+        task = asyncio.create_task(channel.send(*args, **kwargs))
+
+        def done(task: asyncio.Task) -> None:
+            self._busy.discard(channel_id)
+            self._wakeup.set()
+            if task.cancelled():
+                future.cancel()
+            elif (exception := task.exception()) is not None:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(exception)
+            else:
+                self.sent += 1
+                if not future.done():
+                    future.set_result(task.result())
+
+        task.add_done_callback(done)
+
+    def stats(self) -> dict[str, float]:
+        started = self.sent + self.failed + len(self._busy)
+        return {
+            "queue_depth": self.queue_depth(),
+            "channels_waiting": len(self._queues),
+            "sent": self.sent,
+            "failed": self.failed,
+            "mean_wait": round(self.total_wait / started, 3) if started else 0,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+    def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+
+
+send_scheduler = SendScheduler(
+    channel_limit=int(os.environ.get("SEND_CHANNEL_LIMIT", 5)),
+    channel_period=float(os.environ.get("SEND_CHANNEL_PERIOD", 5)),
+    global_limit=int(os.environ.get("SEND_GLOBAL_LIMIT", 50)),
+    global_period=float(os.environ.get("SEND_GLOBAL_PERIOD", 1)),
+)
@@ -0,0 +1,182 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Job priorities, lowest first: interactions must be acknowledged within 3 seconds.
+INTERACTION = 0
+PASSIVE = 1
+
+
+class JobShed(Exception):
+    """The job was not run because the queue was full or its deadline had passed."""
+
+
+class WorkPool:
+    """
+    Runs page fetching and parsing jobs on a fixed number of workers, so that a burst
+    of messages can't start an unbounded number of downloads. At most max_queue jobs
+    wait for a worker; further ones are rejected, and queued jobs whose deadline has
+    passed are shed instead of run. Jobs are taken by priority, then in arrival order.
+    Each job runs in its own task, so cancelling the caller cancels the job without
+    killing its worker.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        clock: Callable[[], float] = time.monotonic,
+        default_latency: float = 1,
+    ) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.clock = clock
+        self.default_latency = default_latency
+        self._queue: asyncio.PriorityQueue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._queued: Counter[int] = Counter()
+        self._running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def queue(self) -> asyncio.PriorityQueue:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.max_queue)
+        return self._queue
+
+    async def run(
+        self,
+        func: Callable[..., Awaitable],
+        *args,
+        deadline: float | None = None,
+        priority: int = PASSIVE,
+    ) -> Any:
+        """
+        Queue func(*args) and return its result once a worker has run it. Raises JobShed
+        if the queue is full, or if deadline (on the pool's clock) passes before a
+        worker is free.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(
+                (
+                    priority,
+                    next(self._sequence),
+                    self.clock(),
+                    deadline,
+                    future,
+                    func,
+                    args,
+                )
+            )
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobShed("Work queue is full.")
+        self._queued[priority] += 1
+        self.admitted += 1
+        if len(self._workers) < self.workers:
+            self._workers.append(asyncio.create_task(self._work()))
+
+        # Cancelling the caller cancels the future, which cancels or skips the job.
+        return await future
+
+    async def _work(self) -> None:
+        while True:
+            priority, _, queued_at, deadline, future, func, args = (
+                await self.queue.get()
+            )
+            self._queued[priority] -= 1
+            try:
+                if future.cancelled():
+                    continue
+                started_at = self.clock()
+                if deadline is not None and started_at > deadline:
+                    self.shed += 1
+                    future.set_exception(JobShed("Job deadline passed in the queue."))
+                    continue
+                self.total_wait += started_at - queued_at
+                self._running += 1
+                try:
+                    await self._run_job(future, func, args)
+                finally:
+                    self._running -= 1
+                latency = self.clock() - started_at
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(
+        self, future: asyncio.Future, func: Callable[..., Awaitable], args: tuple
+    ) -> None:
+        task = asyncio.ensure_future(func(*args))
+        future.add_done_callback(lambda future: task.cancel())
+        await asyncio.wait([task])
+        if task.cancelled():
+            self.cancelled += 1
+            future.cancel()
+        elif (exception := task.exception()) is not None:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(exception)
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(task.result())
+
+    def estimate(self, priority: int = PASSIVE) -> float:
+        """Estimate how many seconds a job queued now with priority would take to finish."""
+        finished = self.completed + self.failed + self.cancelled
+        latency = self.total_latency / finished if finished else self.default_latency
+        ahead = sum(
+            count for queued, count in self._queued.items() if queued <= priority
+        )
+        free = self.workers - self._running
+        if ahead < free:
+            return latency
+        return ((ahead - free) // self.workers + 1) * latency + latency
+
+    def stats(self) -> dict[str, float]:
+        started = self.completed + self.failed + self.cancelled
+        return {
+            "queue_length": self.queue.qsize() if self._queue is not None else 0,
+            "workers": len(self._workers),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "mean_wait": round(self.total_wait / started, 3) if started else 0,
+            "mean_latency": round(self.total_latency / started, 3) if started else 0,
+            "max_latency": round(self.max_latency, 3),
+        }
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._queue = None
+        self._queued.clear()
+
+
+work_pool = WorkPool(
+    workers=int(os.environ.get("MESSAGE_WORKERS", 8)),
+    max_queue=int(os.environ.get("MESSAGE_QUEUE", 100)),
+)